@@ -0,0 +1,135 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+from database import connect
+from frames import read_frame, to_frame
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+#asyncio data access for running many dashboard queries at once
+#each process runs one event loop in a background thread with an asyncpg
+#pool on it, callbacks hand it a batch of queries and block until the
+#slowest one is back, instead of paying for every round-trip in turn
+#without asyncpg installed the batch runs on threads over the sync pool
+
+_state = {'pid': None, 'loop': None, 'pool': None}
+_lock = threading.Lock()
+
+#`:name` bind parameters, but not `::type` casts
+_PARAM = re.compile(r'(?<![:\w]):(\w+)')
+
+
+#turn a sqlalchemy text() query and its params into asyncpg's $1, $2 form
+def to_positional(query, params=None):
+    params = params or {}
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    sql = _PARAM.sub(replace, str(query))
+    return sql, [params[name] for name in names]
+
+
+def _asyncpg_dsn():
+    #asyncpg wants a plain postgresql:// url without a sqlalchemy driver suffix
+    return re.sub(r'^postgresql\+\w+://', 'postgresql://', config.DATABASE_URL)
+
+
+#the event loop of this process, started on first use and again after a fork
+def _loop():
+    with _lock:
+        if _state['pid'] != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='async-db', daemon=True).start()
+            _state.update(pid=os.getpid(), loop=loop, pool=None)
+        return _state['loop']
+
+
+async def _pool():
+    if _state['pool'] is None:
+        server_settings = {}
+        if config.DB_STATEMENT_TIMEOUT_MS:
+            server_settings['statement_timeout'] = str(config.DB_STATEMENT_TIMEOUT_MS)
+        _state['pool'] = await asyncpg.create_pool(
+            _asyncpg_dsn(),
+            min_size=1,
+            max_size=config.ASYNC_POOL_SIZE,
+            max_inactive_connection_lifetime=config.DB_POOL_RECYCLE,
+            server_settings=server_settings,
+        )
+    return _state['pool']
+
+
+#run one query on the asyncpg pool and return it as a compact DataFrame
+async def fetch_frame(query, params=None):
+    sql, args = to_positional(query, params)
+    pool = await _pool()
+    async with pool.acquire() as connection:
+        statement = await connection.prepare(sql)
+        rows = await statement.fetch(*args)
+        columns = [attribute.name for attribute in statement.get_attributes()]
+    return to_frame([tuple(row) for row in rows], columns)
+
+
+async def _fetch_all(queries, return_exceptions):
+    #open the pool before fanning out so the queries share one pool
+    #if it cannot be opened every query has failed with its error
+    try:
+        await _pool()
+    except Exception as e:
+        if not return_exceptions:
+            raise
+        return [e] * len(queries)
+    frames = await asyncio.gather(*(fetch_frame(query, params) for query, params in queries),
+                                  return_exceptions=return_exceptions)
+    return list(frames)
+
+
+def _read_sql(query, params, return_exceptions=False):
+    try:
+        with connect() as connection:
+            return read_frame(query, params, connection=connection)
+    except Exception as e:
+        if not return_exceptions:
+            raise
+        return e
+
+
+#run a list of (query, params) pairs concurrently, frames come back in order
+#with return_exceptions a failed query leaves its exception in its place
+#instead of failing the whole batch
+#the batch's wall time is recorded as the calling callback's sql time
+def fetch_many(queries, timeout=None, return_exceptions=False):
+    queries = list(queries)
+    if not queries:
+        return []
+    started = time.perf_counter()
+    if asyncpg is None:
+        with ThreadPoolExecutor(max_workers=min(len(queries), config.DB_POOL_SIZE)) as pool:
+            frames = list(pool.map(lambda q: _read_sql(*q, return_exceptions), queries))
+    else:
+        future = asyncio.run_coroutine_threadsafe(_fetch_all(queries, return_exceptions), _loop())
+        frames = future.result(timeout)
+    metrics.observe_sql(time.perf_counter() - started, ' ;; '.join(str(query) for query, _ in queries))
+    metrics.observe_rows(sum(len(df) for df in frames if not isinstance(df, BaseException)))
+    return frames
+
+
+#close the asyncpg pool of this process
+def close():
+    if _state['pid'] == os.getpid() and _state['pool'] is not None:
+        asyncio.run_coroutine_threadsafe(_state['pool'].close(), _state['loop']).result()
+        _state['pool'] = None
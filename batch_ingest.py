@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import config
+import rollups
+import snapshot
+import versions
+from bulk_load import COLUMNS, load_chunks, replace_table
+from ingest import CHUNK_ROWS, iter_csv_file, iter_excel_file
+
+#offline batch ingestion, the load steps of data_wranling.ipynb as a command
+#
+#   python batch_ingest.py Combined_set.csv sql_extract.xlsx
+#   python batch_ingest.py data/          (every csv and excel file in it)
+#
+#csv files of transactions are merged into test_data on the transaction key
+#and the rollups are refreshed for the days they touched, excel extracts
+#replace test_data_two without the `user_id.1` column the join duplicated
+#files are parsed by a pool of processes and each target table is loaded in
+#one transaction with the bulk loader while the rest are still parsing
+#a manifest of checksums remembers what was loaded, unchanged files are
+#skipped on the next run (an extract is reloaded when any of its files changed)
+
+CSV = 'csv'
+EXCEL = 'excel'
+EXTENSIONS = {'.csv': CSV, '.xlsx': EXCEL, '.xlsm': EXCEL}
+
+#columns dropped from every file before it is loaded
+DROP_COLUMNS = ('user_id.1',)
+
+HASH_BLOCK = 1024 * 1024
+
+
+class IngestError(Exception):
+    pass
+
+
+#the supported files among paths, directories are searched (not recursively)
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(os.path.join(path, name) for name in os.listdir(path))
+        else:
+            candidates = [path]
+        for candidate in candidates:
+            extension = os.path.splitext(candidate)[1].lower()
+            if extension in EXTENSIONS:
+                files.append(os.path.abspath(candidate))
+            elif candidate == path:
+                raise IngestError(f"{path}: not a csv or excel file")
+    return list(dict.fromkeys(files))
+
+
+def file_kind(path):
+    return EXTENSIONS[os.path.splitext(path)[1].lower()]
+
+
+def checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+#written next to the target and renamed so an interrupted run never corrupts it
+def save_manifest(path, manifest):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+#runs in a worker process: parse a file, apply the notebook's transformations
+#and spool the chunks to directory for the loader, returns the chunk files
+def spool_file(path, directory, chunk_rows=CHUNK_ROWS):
+    kind = file_kind(path)
+    chunks = iter_csv_file(path, chunk_rows) if kind == CSV else iter_excel_file(path, chunk_rows)
+    spooled = []
+    rows = 0
+    for chunk in chunks:
+        chunk = chunk.drop(columns=[c for c in DROP_COLUMNS if c in chunk])
+        if kind == CSV:
+            missing = [c for c in COLUMNS if c not in chunk]
+            if missing:
+                raise IngestError(f"missing columns {', '.join(missing)}")
+        spool_path = os.path.join(directory, f"{len(spooled):06d}.pkl")
+        chunk.to_pickle(spool_path)
+        spooled.append(spool_path)
+        rows += len(chunk)
+    return {'rows': rows, 'chunks': spooled}
+
+
+#the chunks of the parsed files in the order they finish parsing
+#a file that failed to parse is recorded in outcomes and left out, unless
+#strict, where it aborts the load
+def _parsed_chunks(futures, outcomes, strict):
+    for future in as_completed(futures):
+        path = futures[future]
+        try:
+            spooled = future.result()
+        except Exception as e:
+            outcomes[path] = f"failed: {e}"
+            if strict:
+                raise IngestError(f"{path}: {e}") from e
+            continue
+        for spool_path in spooled['chunks']:
+            chunk = pd.read_pickle(spool_path)
+            os.remove(spool_path)
+            yield chunk
+        outcomes[path] = f"{spooled['rows']} rows"
+
+
+#recompute the rollups for the days a load touched, inside its transaction
+def _refresh_rollups(connection, report):
+    rollups.refresh_days(connection, report.first_datetime, report.last_datetime)
+
+
+def _log(message):
+    print(message, file=sys.stderr)
+
+
+#load the files that changed since the manifest was written
+#returns {path: outcome}, an outcome starting with 'failed' marks an error
+def ingest(paths, manifest_path=None, csv_table='test_data', excel_table='test_data_two',
+           workers=None, force=False, chunk_rows=CHUNK_ROWS):
+    manifest_path = manifest_path or config.INGEST_MANIFEST
+    workers = workers or config.INGEST_WORKERS or os.cpu_count()
+    files = find_files(paths)
+    tables = {CSV: csv_table, EXCEL: excel_table}
+    manifest = load_manifest(manifest_path)
+    outcomes = {}
+    spool = tempfile.mkdtemp(prefix='dashboard-ingest-')
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        checksums = dict(zip(files, pool.map(checksum, files)))
+
+        def unchanged(path):
+            entry = manifest.get(path)
+            return (not force and entry is not None and entry['sha256'] == checksums[path]
+                    and entry['table'] == tables[file_kind(path)])
+
+        csv_files = [f for f in files if file_kind(f) == CSV and not unchanged(f)]
+        excel_files = [f for f in files if file_kind(f) == EXCEL]
+        #a replaced table needs all of its files, not just the changed ones
+        if all(unchanged(f) for f in excel_files):
+            excel_files = []
+        for path in files:
+            if path not in csv_files and path not in excel_files:
+                outcomes[path] = 'skipped, unchanged'
+
+        #parse everything up front, the loads consume the files as they finish
+        futures = {}
+        for kind, kind_files in ((CSV, csv_files), (EXCEL, excel_files)):
+            futures[kind] = {}
+            for i, path in enumerate(kind_files):
+                directory = os.path.join(spool, kind, str(i))
+                os.makedirs(directory)
+                futures[kind][pool.submit(spool_file, path, directory, chunk_rows)] = path
+
+        loaded_any = False
+        if futures[CSV]:
+            started = time.perf_counter()
+            #the rollups are refreshed in the load's transaction, a load never
+            #commits without them and a failed refresh leaves the files to reload
+            on_merge = _refresh_rollups if csv_table == 'test_data' else None
+            report = load_chunks(_parsed_chunks(futures[CSV], outcomes, strict=False), table=csv_table,
+                                 on_merge=on_merge)
+            if csv_table == 'test_data':
+                snapshot.refresh_range(report.first_datetime, report.last_datetime)
+            _log(f"{csv_table}: {report} ({time.perf_counter() - started:.1f}s with rollups)")
+            loaded_any = report.rows_staged > 0
+            _record(manifest, manifest_path, futures[CSV], outcomes, checksums, csv_table)
+        if futures[EXCEL]:
+            try:
+                report = replace_table(_parsed_chunks(futures[EXCEL], outcomes, strict=True), table=excel_table)
+            except IngestError as e:
+                _log(f"{excel_table}: not replaced, {e}")
+                for path in futures[EXCEL].values():
+                    outcomes.setdefault(path, 'not loaded, another extract failed')
+            else:
+                _log(f"{excel_table}: {report}")
+                loaded_any = True
+                _record(manifest, manifest_path, futures[EXCEL], outcomes, checksums, excel_table)
+        if loaded_any:
+            versions.bump()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        shutil.rmtree(spool, ignore_errors=True)
+    return outcomes
+
+
+#remember the files that made it into a committed load
+def _record(manifest, manifest_path, futures, outcomes, checksums, table):
+    for path in futures.values():
+        if outcomes.get(path, '').startswith(('failed', 'not loaded')):
+            continue
+        manifest[path] = {
+            'sha256': checksums[path],
+            'table': table,
+            'size': os.path.getsize(path),
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+    save_manifest(manifest_path, manifest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load csv and excel files into the dashboard database.')
+    parser.add_argument('paths', nargs='+', help='files, or directories whose csv and excel files are loaded')
+    parser.add_argument('--manifest', help=f"checksum manifest, {config.INGEST_MANIFEST} by default")
+    parser.add_argument('--csv-table', default='test_data', help='table csv files are merged into')
+    parser.add_argument('--excel-table', default='test_data_two', help='table excel extracts replace')
+    parser.add_argument('--workers', type=int, help='parsing processes, one per core by default')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--force', action='store_true', help='load every file, changed or not')
+    args = parser.parse_args(argv)
+
+    try:
+        outcomes = ingest(args.paths, args.manifest, args.csv_table, args.excel_table,
+                          args.workers, args.force, args.chunk_rows)
+    except IngestError as e:
+        _log(str(e))
+        return 2
+    for path, outcome in outcomes.items():
+        _log(f"{path}: {outcome}")
+    return 1 if any(o.startswith(('failed', 'not loaded')) for o in outcomes.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+#benchmarks and load tests for the dashboard, see benchmarks/run.py
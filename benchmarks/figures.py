@@ -0,0 +1,157 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+#micro-benchmark of the chart figures, no database needed
+#builds each chart from frames shaped like the callbacks' query results the
+#way the callbacks used to (plotly express, the plotly_dark template and an
+#update_layout restyle) and with figures.py, then serializes it the way dash
+#does for the response, reports cpu time per figure and the response size
+#
+#   python -m benchmarks.figures --days 1500 --repeat 50 --out figures.json
+
+
+def _frames(days, seed):
+    rng = np.random.default_rng(seed)
+    years = pd.DataFrame({
+        'value': rng.uniform(1e6, 5e6, 3).round(2),
+        'year': pd.Categorical([2017, 2018, 2019]),
+    })
+    dates = pd.DataFrame({
+        'transactions': rng.integers(50, 400, days).astype('int32'),
+        'transaction_date': pd.date_range('2017-01-01', periods=days, freq='D'),
+    })
+    months = pd.DataFrame({
+        'received': rng.uniform(1e6, 4e6, 36).round(2),
+        'sent': rng.uniform(1e6, 4e6, 36).round(2),
+        'balance': rng.uniform(4e7, 6e7, 36).round(2),
+        'years': pd.Categorical(np.repeat([2017, 2018, 2019], 12)),
+        'month': np.tile(np.arange(12, 0, -1, dtype='int32'), 3),
+    })
+    return years, dates, months
+
+
+_STYLE = dict(
+    paper_bgcolor='rgba(0,0,0,0)',
+    plot_bgcolor='rgba(0,0,0,0)',
+    title_font_color='#FF6347',
+    legend_title_font_color='#FF6347',
+    legend_font_color='#FF6347',
+    font_color='#FF6347',
+)
+
+
+#the figures as the callbacks built them with plotly express
+def _express(years, dates, months):
+    import plotly.express as px
+
+    def pie():
+        fig = px.pie(years, values='value', names='year', title='Transactions Per Year',
+                     color_discrete_sequence=['#FFA500', '#FF6347'], template='plotly_dark')
+        return fig.update_layout(**_STYLE)
+
+    def doughnut():
+        fig = px.pie(years, values='value', names='year', title='Total Amount Sent Per Year', hole=0.6,
+                     color_discrete_sequence=['#FF6347'], template='plotly_dark')
+        return fig.update_layout(
+            annotations=[dict(text='Sent', x=0.5, y=0.5, font_size=20, showarrow=False, font_color='white')],
+            **_STYLE)
+
+    def date_bar():
+        fig = px.bar(dates, x='transaction_date', y='transactions', title='Transactions Per Date',
+                     color='transactions', color_discrete_sequence=['#FFA500', '#FF6347'], template='plotly_dark')
+        return fig.update_layout(xaxis=dict(showgrid=False), yaxis=dict(showgrid=False),
+                                 uirevision='transactions-per-date', **_STYLE)
+
+    def grouped_bar():
+        fig = px.bar(months, x='month', y=['received', 'sent', 'balance'], barmode='group',
+                     title='Amount Received, Sent, and Net Balance Per Month',
+                     color_discrete_sequence=['#FF6347', '#FFA500', '#FF4500'], template='plotly_dark')
+        fig.update_layout(xaxis=dict(showgrid=False), yaxis=dict(showgrid=False), **_STYLE)
+        return fig.update_traces(width=0.2)
+
+    return {'pie': pie, 'doughnut': doughnut, 'date_bar': date_bar, 'grouped_bar': grouped_bar}
+
+
+#the same figures from figures.py, as the callbacks build them now
+def _lean(years, dates, months):
+    import figures
+
+    def date_bar():
+        fig = figures.scaled_bar(figures.date_strings(dates['transaction_date']), dates['transactions'],
+                                 'Transactions Per Date', x_title='transaction_date', y_title='transactions')
+        return fig.update_layout(uirevision='transactions-per-date')
+
+    return {
+        'pie': lambda: figures.pie(years['year'], years['value'], 'Transactions Per Year',
+                                   colors=[figures.ORANGE, figures.TOMATO]),
+        'doughnut': lambda: figures.pie(years['year'], years['value'], 'Total Amount Sent Per Year',
+                                        colors=[figures.TOMATO], hole=0.6, center_text='Sent'),
+        'date_bar': date_bar,
+        'grouped_bar': lambda: figures.grouped_bar(
+            figures.numbers(months['month']),
+            {'received': months['received'], 'sent': months['sent'], 'balance': months['balance']},
+            'Amount Received, Sent, and Net Balance Per Month', x_title='month', width=0.2),
+    }
+
+
+#cpu seconds to build and serialize a figure, and the size of the json
+def _measure(build, repeat):
+    from plotly.io.json import to_json_plotly
+
+    timings = []
+    body = ''
+    for _ in range(repeat):
+        started = time.process_time()
+        body = to_json_plotly(build())
+        timings.append(time.process_time() - started)
+    return timings, len(body.encode('utf-8'))
+
+
+def run(days, repeat, seed=0):
+    frames = _frames(days, seed)
+    results = []
+    builders = {'express': _express(*frames), 'figures': _lean(*frames)}
+    for chart in builders['express']:
+        for variant, charts in builders.items():
+            charts[chart]()  #warm up imports and validators
+            timings, size = _measure(charts[chart], repeat)
+            entry = {
+                'benchmark': f"figure.{chart}.{variant}",
+                'days': days,
+                'repeat': repeat,
+                'median_cpu_s': statistics.median(timings),
+                'min_cpu_s': min(timings),
+                'response_bytes': size,
+            }
+            results.append(entry)
+            print(f"{entry['benchmark']:<32} median {entry['median_cpu_s'] * 1000:8.2f} ms cpu"
+                  f"  {size:>9,} bytes", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark building and serializing the dashboard figures.')
+    parser.add_argument('--days', type=int, default=1095, help='bars in the transactions per date chart')
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the json results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = run(args.days, args.repeat, args.seed)
+    payload = json.dumps({'results': results}, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+#seeded generator of m-pesa shaped transactions
+#the columns match test_data and the same seed and chunk size always give
+#the same rows, rows are produced in chunks so 10^8 rows never have to fit
+#in memory
+
+COLUMNS = [
+    'transaction_id',
+    'customer_id',
+    'transaction_datetime',
+    'sent_amount',
+    'received_amount',
+    'balance_then',
+]
+
+#the years the real data covers
+START = np.datetime64('2017-01-01T00:00:00', 's')
+END = np.datetime64('2020-01-01T00:00:00', 's')
+
+
+#yield DataFrames of at most chunk_rows rows, rows in total
+#customers defaults to one customer per 50 transactions
+def generate(rows, seed=0, chunk_rows=1_000_000, customers=None):
+    customers = customers or max(rows // 50, 1)
+    span = int((END - START) / np.timedelta64(1, 's'))
+    for offset in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - offset)
+        #one generator per chunk so any chunk can be regenerated on its own
+        rng = np.random.default_rng([seed, offset])
+        amounts = np.round(rng.lognormal(mean=6.5, sigma=1.2, size=n), 2)
+        sent = rng.random(n) < 0.55
+        yield pd.DataFrame({
+            'transaction_id': pd.Series(np.arange(offset, offset + n)).map('T{:010d}'.format),
+            'customer_id': pd.Series(rng.zipf(1.3, n) % customers).map('C{:08d}'.format),
+            'transaction_datetime': START + rng.integers(0, span, n).astype('timedelta64[s]'),
+            'sent_amount': np.where(sent, amounts, 0.0),
+            'received_amount': np.where(sent, 0.0, amounts),
+            'balance_then': np.round(rng.lognormal(mean=8, sigma=1.5, size=n), 2),
+        }, columns=COLUMNS)
+
+
+#write the generated rows to a csv file, in the upload format
+def to_csv(path, rows, seed=0, chunk_rows=1_000_000):
+    for i, chunk in enumerate(generate(rows, seed, chunk_rows)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic M-Pesa transactions as csv.')
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    to_csv(args.path, args.rows, args.seed)
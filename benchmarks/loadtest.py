@@ -0,0 +1,216 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+#concurrent viewer load test for a running dashboard
+#reads the callback graph from /_dash-dependencies, builds the same
+#/_dash-update-component requests the browser sends for the refresh driven
+#callbacks and the years-un dropdown, and replays them from N clients
+#
+#   python -m benchmarks.loadtest http://127.0.0.1:8050 --clients 50 --duration 60
+#
+#each client first asks check_data_version for the data version, like the
+#browser's data-version store, and hands it to refresh_dashboard_data, which
+#must answer 200 with a body (the prefetch ran), the other callbacks may also
+#answer 204 (PreventUpdate)
+
+#inputs that mark a callback as part of a dashboard refresh
+REFRESH_INPUTS = {'interval-component', 'data-version', 'dashboard-data', 'years-un'}
+
+VERSION_OUTPUT = 'data-version.data'
+REFRESH_OUTPUT = 'dashboard-data.data'
+
+
+def _post(url, payload, timeout):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, response.read()
+
+
+def _get_json(url, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+#split dash's output string into (id, property) pairs
+#multi output callbacks look like `..a.children...b.children..`
+def _outputs(output):
+    if output.startswith('..'):
+        parts = output.strip('.').split('...')
+    else:
+        parts = [output]
+    return [tuple(part.rsplit('.', 1)) for part in parts]
+
+
+#value a browser would send for an input or state, years are picked at random
+#version is the data version the client last got from check_data_version
+def _value(component, prop, years, tick, version):
+    if (component, prop) == ('years-un', 'value'):
+        return random.choice(years + [None])
+    if (component, prop) == ('interval-component', 'n_intervals'):
+        return tick
+    if (component, prop) == ('data-version', 'data'):
+        return version
+    if (component, prop) == ('dashboard-data', 'data'):
+        return 1
+    return None
+
+
+def _payload(dependency, years, tick, version=None):
+    outputs = [{'id': c, 'property': p} for c, p in _outputs(dependency['output'])]
+    inputs = [dict(i, value=_value(i['id'], i['property'], years, tick, version)) for i in dependency['inputs']]
+    state = [dict(s, value=_value(s['id'], s['property'], years, tick, version))
+             for s in dependency.get('state', [])]
+    return {
+        'output': dependency['output'],
+        'outputs': outputs if len(outputs) > 1 else outputs[0],
+        'inputs': inputs,
+        'state': state,
+        'changedPropIds': [f"{inputs[0]['id']}.{inputs[0]['property']}"],
+    }
+
+
+#the data version in a check_data_version response body
+def _version(body):
+    return json.loads(body)['response']['data-version']['data']
+
+
+#the refresh and dropdown callbacks of the running app, in the order the
+#browser runs them: version check, refresh, then the panels
+def discover(base_url, timeout):
+    dependencies = _get_json(f"{base_url}/_dash-dependencies", timeout)
+    selected = []
+    for dependency in dependencies:
+        if dependency.get('clientside_function'):
+            continue
+        if any(i['id'] in REFRESH_INPUTS for i in dependency['inputs']):
+            selected.append(dependency)
+    order = {VERSION_OUTPUT: 0, REFRESH_OUTPUT: 1}
+    return sorted(selected, key=lambda d: order.get(d['output'], 2))
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class _Results:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, name, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _client(url, dependencies, years, deadline, think, timeout, results):
+    tick = 0
+    version = None
+    while time.monotonic() < deadline:
+        tick += 1
+        for dependency in dependencies:
+            if time.monotonic() >= deadline:
+                return
+            output = dependency['output']
+            started = time.perf_counter()
+            try:
+                status, body = _post(url, _payload(dependency, years, tick, version), timeout)
+                if output == VERSION_OUTPUT and status == 200:
+                    version = _version(body)
+                if output == REFRESH_OUTPUT:
+                    #a 204 here means the refresh was skipped, not measured
+                    ok = status == 200 and bool(body)
+                else:
+                    ok = status in (200, 204)
+            except (urllib.error.URLError, OSError, ValueError, KeyError):
+                ok = False
+            results.add(output, time.perf_counter() - started, ok)
+        if think:
+            time.sleep(random.uniform(0, 2 * think))
+
+
+#replay the callbacks from `clients` threads for `duration` seconds
+def run(base_url, clients=10, duration=30, think=0.0, timeout=60, years=None):
+    base_url = base_url.rstrip('/')
+    dependencies = discover(base_url, timeout)
+    if not dependencies:
+        raise SystemExit('no refresh callbacks found at ' + base_url)
+    years = years or [2017, 2018, 2019]
+    results = _Results()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_client,
+                         args=(f"{base_url}/_dash-update-component", dependencies, years,
+                               deadline, think, timeout, results))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = []
+    for name, latencies in sorted(results.latencies.items()):
+        latencies.sort()
+        report.append({
+            'callback': name,
+            'requests': len(latencies),
+            'errors': results.errors.get(name, 0),
+            'error_rate': results.errors.get(name, 0) / len(latencies),
+            'throughput_rps': len(latencies) / elapsed,
+            'p50_ms': _percentile(latencies, 0.50) * 1000,
+            'p95_ms': _percentile(latencies, 0.95) * 1000,
+            'p99_ms': _percentile(latencies, 0.99) * 1000,
+        })
+    return {'clients': clients, 'duration_s': elapsed, 'callbacks': report}
+
+
+def _print(summary):
+    print(f"{summary['clients']} clients for {summary['duration_s']:.1f}s", file=sys.stderr)
+    print(f"{'callback':<60} {'req':>7} {'err%':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}", file=sys.stderr)
+    for row in summary['callbacks']:
+        print(f"{row['callback'][:60]:<60} {row['requests']:>7} {row['error_rate'] * 100:>5.1f}% "
+              f"{row['throughput_rps']:>8.1f} {row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms",
+              file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay dashboard callbacks from many simulated viewers.')
+    parser.add_argument('url', help='base url of the running dashboard, e.g. http://127.0.0.1:8050')
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--think', type=float, default=0.0, help='mean seconds a client waits between refreshes')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--years', type=int, nargs='*', help='values to pick from for the years-un dropdown')
+    parser.add_argument('--out', help='also write the json report here')
+    args = parser.parse_args(argv)
+
+    summary = run(args.url, args.clients, args.duration, args.think, args.timeout, args.years)
+    _print(summary)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if any(row['errors'] for row in summary['callbacks']) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+#benchmark suite for the dashboard
+#generates seeded m-pesa data, loads it into an embedded duckdb file that
+#stands in for postgres (through the same sqlalchemy engine the app uses)
+#and times the kpi and chart queries, the rollup maintenance, the upload
+#parsing path and the callbacks end to end, results are written as json
+#and can be compared against a baseline to catch regressions
+#
+#   python -m benchmarks.run --rows 100000 1000000 --out results.json
+#   python -m benchmarks.run --rows 100000 --baseline results.json
+#
+#needs duckdb and duckdb_engine, the bulk COPY loader is postgres only
+#and is not part of the offline suite
+
+
+#point the app at the stand-in before any of its modules read config
+def _configure(workdir):
+    os.environ['DATABASE_URL'] = f"duckdb:///{os.path.join(workdir, 'bench.duckdb')}"
+    os.environ['CACHE_ENABLED'] = '0'
+    os.environ['CACHE_PATH'] = os.path.join(workdir, 'cache.sqlite')
+    os.environ['JOBS_DIR'] = os.path.join(workdir, 'jobs')
+
+
+CREATE_TEST_DATA = '''
+    create table test_data (
+        transaction_id text not null,
+        customer_id text,
+        transaction_datetime timestamp not null,
+        sent_amount double precision,
+        received_amount double precision,
+        balance_then double precision
+    )
+'''
+
+
+def _time(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return timings, result
+
+
+def _record(results, name, rows, timings, result=None):
+    entry = {
+        'benchmark': name,
+        'rows': rows,
+        'repeat': len(timings),
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'max_s': max(timings),
+    }
+    if hasattr(result, '__len__'):
+        entry['result_rows'] = len(result)
+    results.append(entry)
+    print(f"{name:<45} {rows:>12,} rows  median {entry['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+
+
+#drop and reload test_data and the rollups with `rows` generated rows
+def _load(rows, seed, chunk_rows):
+    from sqlalchemy import text
+
+    import rollups
+    import versions
+    from benchmarks.generate import generate
+    from database import get_engine
+
+    engine = get_engine()
+    with engine.begin() as connection:
+        connection.execute(text('drop table if exists test_data'))
+        connection.execute(text('drop table if exists daily_rollup'))
+        connection.execute(text(CREATE_TEST_DATA))
+    raw = engine.raw_connection()
+    try:
+        duck = raw.driver_connection
+        started = time.perf_counter()
+        for chunk in generate(rows, seed, chunk_rows):
+            duck.register('chunk', chunk)
+            duck.execute('insert into test_data select * from chunk')
+            duck.unregister('chunk')
+        load_seconds = time.perf_counter() - started
+    finally:
+        raw.close()
+    started = time.perf_counter()
+    rollups.rebuild()
+    rebuild_seconds = time.perf_counter() - started
+    versions.bump()
+    return load_seconds, rebuild_seconds
+
+
+def _query_benchmarks(results, rows, repeat):
+    import rollups
+    from frames import read_frame
+    from kpis import KPI_QUERY
+
+    bounds = rollups.read_rollup(rollups.DATE_RANGE)
+    first_day, last_day = bounds['first_day'].iloc[0], bounds['last_day'].iloc[0]
+    queries = {
+        'query.kpis': (KPI_QUERY, None),
+        'query.years': (rollups.YEARS, None),
+        'query.date_range': (rollups.DATE_RANGE, None),
+        'query.transactions_per_year': (rollups.TRANSACTIONS_PER_YEAR, None),
+        'query.sent_per_year': (rollups.SENT_PER_YEAR, None),
+        'query.received_per_year': (rollups.RECEIVED_PER_YEAR, None),
+        'query.net_balance_per_year': (rollups.NET_BALANCE_PER_YEAR, None),
+        'query.amounts_per_month': (rollups.AMOUNTS_PER_MONTH, None),
+        'query.amounts_per_month_for_year': (rollups.AMOUNTS_PER_MONTH_FOR_YEAR, {'year': 2018}),
+        'query.transactions_per_day': (rollups.TRANSACTIONS_PER_PERIOD,
+                                       {'grain': 'day', 'start_day': first_day, 'end_day': last_day}),
+    }
+    for name, (query, params) in queries.items():
+        timings, result = _time(lambda: read_frame(query, params), repeat)
+        _record(results, name, rows, timings, result)
+
+    #headline kpis exactly and from the distinct count sketches
+    from kpis import fetch_kpis
+
+    kpis = {}
+    for mode in ('exact', 'fast'):
+        timings, kpis[mode] = _time(lambda: fetch_kpis(mode), repeat)
+        _record(results, f'kpis.fetch_{mode}', rows, timings)
+    for name in ('total_customers', 'total_transactions'):
+        exact = getattr(kpis['exact'], name)
+        results[-1][f'{name}_error'] = abs(getattr(kpis['fast'], name) - exact) / exact if exact else 0.0
+
+    #incremental rollup maintenance for one day of new rows
+    from database import get_engine
+
+    def refresh_one_day():
+        with get_engine().begin() as connection:
+            rollups.refresh_days(connection, last_day, last_day)
+    timings, _ = _time(refresh_one_day, repeat)
+    _record(results, 'rollups.refresh_one_day', rows, timings)
+
+
+#stream the whole fact table out to csv in compact batches
+def _export_benchmark(results, rows, workdir):
+    from sqlalchemy import text
+
+    from frames import export_csv
+
+    path = os.path.join(workdir, 'export.csv')
+    timings, _ = _time(lambda: export_csv(text('select * from test_data'), path), 1)
+    _record(results, 'export.test_data_csv', rows, timings)
+
+
+#parse, summarise and plot an upload of `rows` rows, everything but the COPY
+def _upload_benchmark(results, rows, seed, repeat, workdir):
+    import jobs
+    from benchmarks.generate import to_csv
+    from ingest import UploadSummary, iter_csv_chunks
+
+    path = os.path.join(workdir, 'upload.csv')
+    to_csv(path, rows, seed + 1)
+    with open(path, 'rb') as f:
+        contents = 'data:text/csv;base64,' + base64.b64encode(f.read()).decode('ascii')
+
+    def run():
+        summary = UploadSummary()
+        for chunk in iter_csv_chunks(contents):
+            summary.update(chunk)
+        jobs.format_summary(summary)
+        return jobs.upload_figure(summary.histogram).to_json()
+    timings, payload = _time(run, repeat)
+    _record(results, 'upload.parse_summarise_plot', rows, timings)
+    results[-1]['response_bytes'] = len(payload)
+
+
+#call the dash callbacks the way a page refresh does
+def _callback_benchmarks(results, rows, repeat):
+    import app
+
+    callbacks = {
+        'callback.update_kpis': lambda: app.update_kpis(1),
+        'callback.update_year_options': lambda: app.update_year_options(1),
+        'callback.plot_transactions_pie_chart': lambda: app.plot_transactions_pie_chart(1),
+        'callback.plot_transactions_bar_chart': lambda: app.plot_transactions_bar_chart(1, None),
+        'callback.plot_received_amount_per_year_dchart': lambda: app.plot_received_amount_per_year_dchart(1),
+        'callback.plot_total_sent_amount_per_year_dchart': lambda: app.plot_total_sent_amount_per_year_dchart(1),
+        'callback.plot_total_net_balance_per_year_dchart': lambda: app.plot_total_net_balance_per_year_dchart(1),
+        'callback.plot_grouped_bar_chart': lambda: app.plot_grouped_bar_chart(1, None),
+        'callback.plot_grouped_bar_chart_for_year': lambda: app.plot_grouped_bar_chart(1, 2018),
+        'callback.update_top_customers': lambda: app.update_top_customers(1, 'transactions'),
+        'callback.show_customer': lambda: app.show_customer(1, 'C00000001'),
+    }
+    total = []
+    for name, fn in callbacks.items():
+        timings, _ = _time(fn, repeat)
+        _record(results, name, rows, timings)
+        total.append(statistics.median(timings))
+    results.append({'benchmark': 'callback.page_refresh_sum', 'rows': rows, 'repeat': repeat,
+                    'median_s': sum(total), 'min_s': sum(total), 'max_s': sum(total)})
+
+
+#benchmarks whose median got slower than the baseline by more than tolerance
+def compare(results, baseline, tolerance):
+    previous = {(r['benchmark'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['benchmark'], result['rows']))
+        if before and result['median_s'] > before['median_s'] * (1 + tolerance):
+            regressions.append((result['benchmark'], result['rows'], before['median_s'], result['median_s']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard against an embedded stand-in database.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000],
+                        help='table sizes to benchmark, e.g. 100000 1000000 10000000')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    parser.add_argument('--upload-rows', type=int, default=200_000,
+                        help='size of the synthetic upload, capped at each table size')
+    parser.add_argument('--workdir', help='where the stand-in database lives, a temporary directory by default')
+    parser.add_argument('--out', help='write the json results here instead of stdout')
+    parser.add_argument('--baseline', help='json results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown over the baseline before failing, 0.25 = 25%%')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='dashboard-bench-')
+    _configure(workdir)
+
+    results = []
+    for rows in args.rows:
+        load_seconds, rebuild_seconds = _load(rows, args.seed, args.chunk_rows)
+        _record(results, 'load.generate_and_insert', rows, [load_seconds])
+        _record(results, 'rollups.rebuild', rows, [rebuild_seconds])
+        _query_benchmarks(results, rows, args.repeat)
+        _export_benchmark(results, rows, workdir)
+        _upload_benchmark(results, min(rows, args.upload_rows), args.seed, args.repeat, workdir)
+        _callback_benchmarks(results, rows, args.repeat)
+
+    output = {
+        'meta': {
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, rows, before, after in regressions:
+            print(f"REGRESSION {name} at {rows:,} rows: {before * 1000:.2f} ms -> {after * 1000:.2f} ms",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import io
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+from sqlalchemy import text
+
+from database import get_engine
+from schema import CONFLICT_COLUMNS, ensure_partitions, ensure_schema, lock_writers
+
+#bulk loader for the transaction table
+#rows are streamed into a temporary staging table with COPY FROM STDIN and
+#then merged into the target with one `insert ... on conflict` statement,
+#all in one transaction, so a load never empties the table and readers
+#only ever see the data before or after it
+#loads into the same table run one at a time, and any table or partition a
+#load needs is created in its own short transaction before the merge, so a
+#load never holds a schema lock on the table while it copies and merges
+#the table layout, indexes and partitions are managed by schema.py
+
+COLUMNS = [
+    'transaction_id',
+    'customer_id',
+    'transaction_datetime',
+    'sent_amount',
+    'received_amount',
+    'balance_then',
+]
+
+#the staging table has the target's column types and is dropped on commit
+#it is not created `like` the target, which would lock the target for the
+#whole load and keep the partitions from being created
+CREATE_STAGING = '''
+    create temporary table {staging} (
+        transaction_id text,
+        customer_id text,
+        transaction_datetime timestamp,
+        sent_amount double precision,
+        received_amount double precision,
+        balance_then double precision
+    ) on commit drop
+'''
+
+#merge the staged rows into the target
+#one row per transaction key in the batch is kept, rows identical to
+#what is already stored are left alone
+#every part of the statement reads the table as it was before the merge,
+#so a merged key found in it was an update and one missing an insert
+#(partitioned tables cannot return system columns such as xmax)
+MERGE = '''
+    with merged as (
+        insert into {table} ({columns})
+        select distinct on ({conflict}) {columns}
+        from {staging}
+        where transaction_id is not null and transaction_datetime is not null
+        order by {conflict}
+        on conflict ({conflict}) do update set {updates}
+        where ({current}) is distinct from ({incoming})
+        returning {conflict}
+    )
+    select
+        count(*) filter (where existing.transaction_id is null) as inserted,
+        count(*) filter (where existing.transaction_id is not null) as updated
+    from merged
+    left join {table} existing on {matches}
+'''
+
+
+#outcome of one bulk load
+@dataclass
+class LoadReport:
+    rows_staged: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    first_datetime: object = None
+    last_datetime: object = None
+
+    @property
+    def rows_per_second(self):
+        return self.rows_staged / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.rows_staged} rows loaded in {self.seconds:.1f}s "
+                f"({self.rows_per_second:,.0f} rows/s): {self.inserted} inserted, "
+                f"{self.updated} updated, {self.skipped} skipped")
+
+
+def _copy_chunk(cursor, staging, chunk, columns=COLUMNS):
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, columns=columns, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    sql = f"copy {staging} ({', '.join(_quote(c) for c in columns)}) from stdin with (format csv)"
+    if hasattr(cursor, 'copy_expert'):
+        #psycopg2
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+    else:
+        #psycopg 3
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _merge_sql(table, staging, conflict_columns):
+    value_columns = [c for c in COLUMNS if c not in conflict_columns]
+    return MERGE.format(
+        table=table,
+        staging=staging,
+        columns=', '.join(COLUMNS),
+        conflict=', '.join(conflict_columns),
+        updates=', '.join(f"{c} = excluded.{c}" for c in value_columns),
+        current=', '.join(f"{table}.{c}" for c in value_columns),
+        incoming=', '.join(f"excluded.{c}" for c in value_columns),
+        matches=' and '.join(f"existing.{c} = merged.{c}" for c in conflict_columns),
+    )
+
+
+#copy an iterable of DataFrames into table and merge them on the transaction key
+#on_chunk is called with every chunk after it has been staged
+#on_merge is called with the connection and the report after the merge,
+#before the load commits, raising from either rolls the whole load back
+def load_chunks(chunks, table='test_data', on_chunk=None, on_merge=None):
+    staging = f"{table}_staging"
+    report = LoadReport()
+    started = time.perf_counter()
+    with get_engine().begin() as connection:
+        #large loads are allowed to outlive the dashboard's statement timeout
+        connection.execute(text('set local statement_timeout = 0'))
+        lock_writers(connection, table)
+        connection.execute(text(CREATE_STAGING.format(staging=staging)))
+        cursor = connection.connection.cursor()
+        try:
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                _copy_chunk(cursor, staging, chunk)
+                report.rows_staged += len(chunk)
+                datetimes = chunk['transaction_datetime'].dropna()
+                if len(datetimes):
+                    low, high = datetimes.min(), datetimes.max()
+                    report.first_datetime = low if report.first_datetime is None else min(report.first_datetime, low)
+                    report.last_datetime = high if report.last_datetime is None else max(report.last_datetime, high)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        finally:
+            cursor.close()
+        #create the table and partitions for any new period before the rows
+        #are merged in, committed right away so the schema lock is brief
+        with get_engine().begin() as ddl:
+            ensure_schema(ddl, table)
+            ensure_partitions(ddl, report.first_datetime, report.last_datetime, table)
+        row = connection.execute(text(_merge_sql(table, staging, CONFLICT_COLUMNS))).one()
+        report.inserted, report.updated = int(row.inserted), int(row.updated)
+        if on_merge is not None:
+            on_merge(connection, report)
+    report.skipped = report.rows_staged - report.inserted - report.updated
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+#column type for a chunk column of an extract without a fixed schema
+#numbers go to numeric so a later chunk with a fraction still fits
+def _column_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'timestamp'
+    return 'text'
+
+
+#copy an iterable of DataFrames into a new table and swap it in for table
+#the columns come from the first chunk, for extracts without a transaction
+#key, this is to_sql(if_exists='replace') with COPY in one transaction,
+#readers see the old table until the new one is complete
+def replace_table(chunks, table):
+    loading = f"{table}_loading"
+    report = LoadReport()
+    started = time.perf_counter()
+    columns = None
+    with get_engine().begin() as connection:
+        connection.execute(text('set local statement_timeout = 0'))
+        connection.execute(text(f"drop table if exists {loading}"))
+        cursor = connection.connection.cursor()
+        try:
+            for chunk in chunks:
+                if columns is None:
+                    columns = list(chunk.columns)
+                    definitions = ', '.join(f"{_quote(c)} {_column_type(chunk[c].dtype)}" for c in columns)
+                    connection.execute(text(f"create table {loading} ({definitions})"))
+                if chunk.empty:
+                    continue
+                _copy_chunk(cursor, loading, chunk, columns)
+                report.rows_staged += len(chunk)
+        finally:
+            cursor.close()
+        if columns is None:
+            raise ValueError(f"nothing to load into {table}")
+        connection.execute(text(f"drop table if exists {table}"))
+        connection.execute(text(f"alter table {loading} rename to {table}"))
+    report.inserted = report.rows_staged
+    report.seconds = time.perf_counter() - started
+    return report
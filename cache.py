@@ -0,0 +1,248 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import async_db
+import config
+import metrics
+import paths
+import snapshot
+from database import connect
+from frames import read_frame
+
+#server side cache for query results
+#entries are keyed by the query text, its parameters and the data version
+#loads bump the version so every older entry stops matching
+#the backend is a sqlite file so all dash workers on the host share hits
+#cached frames are pickled, so the file and its directory must only be
+#writable by the dashboard's user, anything else is refused
+#misses are read from postgres, or from the parquet snapshot when
+#QUERY_BACKEND=parquet and it holds every table the query reads
+
+logger = logging.getLogger('dashboard.cache')
+
+_local = threading.local()
+_counters_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'prefetched': 0}
+
+SCHEMA = (
+    '''
+    create table if not exists entries (
+        key text primary key,
+        value blob not null,
+        size integer not null,
+        last_access real not null
+    )
+    ''',
+    '''
+    create index if not exists entries_last_access on entries (last_access)
+    ''',
+    '''
+    create table if not exists meta (
+        name text primary key,
+        value integer not null
+    )
+    ''',
+)
+
+
+#one sqlite connection per thread and process
+#a connection inherited across a fork is never reused
+def _db():
+    db = getattr(_local, 'db', None)
+    if db is None or _local.pid != os.getpid():
+        #nobody else may write to the directory or plant the file (or its wal)
+        paths.private_dir(os.path.dirname(os.path.abspath(config.CACHE_PATH)))
+        paths.check_owner(config.CACHE_PATH, f"{config.CACHE_PATH}-wal", f"{config.CACHE_PATH}-shm")
+        db = sqlite3.connect(config.CACHE_PATH, timeout=10, isolation_level=None)
+        db.execute('pragma journal_mode=wal')
+        db.execute('pragma synchronous=normal')
+        for statement in SCHEMA:
+            db.execute(statement)
+        _local.db = db
+        _local.pid = os.getpid()
+    return db
+
+
+def _count(name, n=1):
+    with _counters_lock:
+        _counters[name] += n
+
+
+#the current data version, 0 until the first load
+def current_version():
+    row = _db().execute("select value from meta where name = 'version'").fetchone()
+    return row[0] if row else 0
+
+
+#invalidate every cached result, called after each load
+def bump_version():
+    db = _db()
+    db.execute(
+        '''
+        insert into meta (name, value) values ('version', 1)
+        on conflict (name) do update set value = value + 1
+        '''
+    )
+    #old entries can never match again, free their space straight away
+    db.execute('delete from entries')
+    return current_version()
+
+
+#follow the data version kept in postgres (see versions.py)
+#the local version is bumped whenever the database's has moved
+def sync_version(source_version):
+    db = _db()
+    row = db.execute("select value from meta where name = 'source_version'").fetchone()
+    if row is not None and row[0] == source_version:
+        return
+    db.execute(
+        '''
+        insert into meta (name, value) values ('source_version', ?)
+        on conflict (name) do update set value = excluded.value
+        ''',
+        (source_version,),
+    )
+    bump_version()
+
+
+def make_key(query, params=None, version=None):
+    if version is None:
+        version = current_version()
+    payload = json.dumps(
+        [str(query), params or {}, version],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    db = _db()
+    row = db.execute('select value from entries where key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+    db.execute('update entries set last_access = ? where key = ?', (time.time(), key))
+    return pickle.loads(row[0])
+
+
+def _has(key):
+    return _db().execute('select 1 from entries where key = ?', (key,)).fetchone() is not None
+
+
+def put(key, value):
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(blob) > config.CACHE_MAX_BYTES:
+        return
+    db = _db()
+    db.execute(
+        'insert or replace into entries (key, value, size, last_access) values (?, ?, ?, ?)',
+        (key, blob, len(blob), time.time()),
+    )
+    _evict(db)
+
+
+#drop the least recently used entries until the cache fits its budget
+def _evict(db):
+    total = db.execute('select coalesce(sum(size), 0) from entries').fetchone()[0]
+    if total <= config.CACHE_MAX_BYTES:
+        return
+    evicted = 0
+    for key, size in db.execute('select key, size from entries order by last_access').fetchall():
+        if total <= config.CACHE_MAX_BYTES:
+            break
+        db.execute('delete from entries where key = ?', (key,))
+        total -= size
+        evicted += 1
+    _count('evictions', evicted)
+
+
+#drop in replacement for pd.read_sql that answers from the cache when it can
+#results are compact frames (see frames.py), which also keeps the cache small
+#a pooled connection is only borrowed on a miss, so a hit is a keyed lookup
+#that never touches postgres
+def read_cached(query, params=None):
+    with metrics.data_read():
+        return _read_cached(query, params)
+
+
+def _read_cached(query, params):
+    if config.CACHE_ENABLED:
+        key = make_key(query, params)
+        df = get(key)
+        if df is not None:
+            _count('hits')
+            return df
+        _count('misses')
+    df = _read_source(query, params)
+    if config.CACHE_ENABLED:
+        put(key, df)
+    return df
+
+
+def _read_source(query, params):
+    if snapshot.handles(query):
+        return snapshot.read(query, params)
+    with connect() as connection:
+        return read_frame(query, params, connection=connection)
+
+
+#make sure every (query, params) pair is cached
+#the misses are fetched concurrently, so a refresh costs its slowest query
+#a query that fails is logged and left uncached, the callback reading it
+#runs it again through read_cached and reports its own error
+#with CACHE_ENABLED=0 there is nowhere to keep the results, so this does
+#nothing and every callback runs its own queries one after another
+def prefetch(queries):
+    if not config.CACHE_ENABLED:
+        return
+    with metrics.data_read():
+        _prefetch(queries)
+
+
+def _prefetch(queries):
+    version = current_version()
+    missing = []
+    for query, params in queries:
+        key = make_key(query, params, version)
+        if not _has(key):
+            missing.append((key, query, params))
+    #the callbacks' own read_cached lookups count the hits and misses,
+    #counting here as well would count every refresh twice
+    local = [m for m in missing if snapshot.handles(m[1])]
+    remote = [m for m in missing if m not in local]
+    results = []
+    for key, query, params in local:
+        try:
+            results.append(snapshot.read(query, params))
+        except Exception as e:
+            results.append(e)
+    results.extend(async_db.fetch_many(((query, params) for _, query, params in remote), return_exceptions=True))
+    for (key, query, _), df in zip(local + remote, results):
+        if isinstance(df, BaseException):
+            logger.warning('prefetch of %s failed: %s', ' '.join(str(query).split()), df)
+            continue
+        put(key, df)
+        _count('prefetched')
+
+
+#hit/miss counters for this process plus the size of the shared cache
+def cache_stats():
+    db = _db()
+    entries, size = db.execute('select count(*), coalesce(sum(size), 0) from entries').fetchone()
+    with _counters_lock:
+        stats = dict(_counters)
+    lookups = stats['hits'] + stats['misses']
+    stats.update({
+        'hit_ratio': stats['hits'] / lookups if lookups else 0.0,
+        'entries': entries,
+        'bytes': size,
+        'max_bytes': config.CACHE_MAX_BYTES,
+        'version': current_version(),
+    })
+    return stats
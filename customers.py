@@ -0,0 +1,195 @@
+import pandas as pd
+from sqlalchemy import text
+
+from cache import read_cached
+from database import get_engine
+from schema import lock_writers
+
+#per customer aggregates of test_data
+#the latest record, totals and transaction counts of a customer are kept in
+#customer_features keyed by customer_id instead of being derived with window
+#functions over every row, so the top customers and a customer's profile are
+#index lookups whatever the size of test_data
+#loads refresh only the customers that have rows in the days they touched
+
+CREATE_CUSTOMER_FEATURES = (
+    '''
+    create table if not exists customer_features (
+        customer_id text primary key,
+        transactions bigint not null,
+        sent double precision not null,
+        received double precision not null,
+        first_transaction timestamp,
+        last_transaction timestamp,
+        last_balance double precision
+    )
+    ''',
+    #one index per ranking the top customers table offers, in its sort order
+    '''
+    create index if not exists customer_features_transactions_idx
+    on customer_features (transactions desc, customer_id)
+    ''',
+    '''
+    create index if not exists customer_features_sent_idx
+    on customer_features (sent desc, customer_id)
+    ''',
+    '''
+    create index if not exists customer_features_received_idx
+    on customer_features (received desc, customer_id)
+    ''',
+)
+
+#the features of a set of customers, recomputed from all of their rows
+#the customer_id index on test_data keeps this proportional to their rows
+#the last balance is the one of the customer's latest transaction
+FEATURES = '''
+    select
+        customer_id,
+        count(*) as transactions,
+        coalesce(sum(sent_amount), 0) as sent,
+        coalesce(sum(received_amount), 0) as received,
+        min(transaction_datetime) as first_transaction,
+        max(transaction_datetime) as last_transaction,
+        (array_agg(balance_then order by transaction_datetime desc, transaction_id desc))[1] as last_balance
+    from test_data
+    where {where}
+    group by customer_id
+'''
+
+UPSERT = '''
+    insert into customer_features
+        (customer_id, transactions, sent, received, first_transaction, last_transaction, last_balance)
+    {features}
+    on conflict (customer_id) do update set
+        transactions = excluded.transactions,
+        sent = excluded.sent,
+        received = excluded.received,
+        first_transaction = excluded.first_transaction,
+        last_transaction = excluded.last_transaction,
+        last_balance = excluded.last_balance
+'''
+
+#customers with a transaction between two days
+TOUCHED_CUSTOMERS = '''
+    customer_id in (
+        select distinct customer_id
+        from test_data
+        where transaction_datetime >= :start_day
+          and transaction_datetime < cast(:end_day as date) + 1
+          and customer_id is not null
+    )
+'''
+
+REFRESH_CUSTOMERS = text(UPSERT.format(features=FEATURES.format(where=TOUCHED_CUSTOMERS)))
+
+REBUILD_ALL = text(
+    '''
+    insert into customer_features
+        (customer_id, transactions, sent, received, first_transaction, last_transaction, last_balance)
+    '''
+    + FEATURES.format(where='customer_id is not null')
+)
+
+#what the top customers table can be ranked by, validated before it is formatted in
+METRICS = {
+    'transactions': 'Transactions',
+    'sent': 'Amount sent',
+    'received': 'Amount received',
+}
+
+TOP_CUSTOMERS = '''
+    select
+        customer_id,
+        transactions,
+        sent,
+        received,
+        last_transaction,
+        last_balance
+    from customer_features
+    order by {metric} desc, customer_id
+    limit :limit
+'''
+
+CUSTOMER = text(
+    '''
+    select
+        customer_id,
+        transactions,
+        sent,
+        received,
+        first_transaction,
+        last_transaction,
+        last_balance
+    from customer_features
+    where customer_id = :customer_id
+    '''
+)
+
+#a customer's activity per day, read through the customer_id index
+CUSTOMER_ACTIVITY = text(
+    '''
+    select
+        date_trunc('day', transaction_datetime)::date as day,
+        count(*) as transactions,
+        coalesce(sum(sent_amount), 0) as sent,
+        coalesce(sum(received_amount), 0) as received
+    from test_data
+    where customer_id = :customer_id
+    group by 1
+    order by 1
+    '''
+)
+
+
+#create the feature table and its indexes if they do not exist yet
+def ensure_features(connection):
+    for statement in CREATE_CUSTOMER_FEATURES:
+        connection.execute(text(statement))
+
+
+#recompute the features of every customer with rows between start and end (inclusive)
+#runs inside the caller's transaction, once the other writers have committed
+def refresh_days(connection, start, end):
+    params = {
+        'start_day': pd.Timestamp(start).date(),
+        'end_day': pd.Timestamp(end).date(),
+    }
+    lock_writers(connection)
+    ensure_features(connection)
+    connection.execute(REFRESH_CUSTOMERS, params)
+
+
+#throw the features away and rebuild them from the whole fact table
+def rebuild(connection):
+    ensure_features(connection)
+    connection.execute(text('delete from customer_features'))
+    connection.execute(REBUILD_ALL)
+
+
+def top_customers_query(metric, limit):
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r}, expected one of {', '.join(METRICS)}")
+    return text(TOP_CUSTOMERS.format(metric=metric)), {'limit': int(limit)}
+
+
+#the `limit` customers with the highest `metric`, through the result cache
+def top_customers(metric='transactions', limit=10):
+    query, params = top_customers_query(metric, limit)
+    return read_cached(query, params)
+
+
+#the stored features of one customer, an empty frame for an unknown id
+def customer_profile(customer_id):
+    return read_cached(CUSTOMER, {'customer_id': str(customer_id)})
+
+
+def customer_activity(customer_id):
+    return read_cached(CUSTOMER_ACTIVITY, {'customer_id': str(customer_id)})
+
+
+if __name__ == "__main__":
+    import versions
+
+    with get_engine().begin() as connection:
+        rebuild(connection)
+    versions.bump()
@@ -0,0 +1,112 @@
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+import config
+import metrics
+
+#one engine per process shared by every callback
+#connections come from a bounded QueuePool instead of a new
+#engine and tcp+auth handshake per call
+_engine = None
+
+
+#create the engine the first time it is needed
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = _create_engine()
+    return _engine
+
+
+def _create_engine():
+    url = make_url(config.DATABASE_URL)
+    if url.get_backend_name() != 'postgresql':
+        #embedded stand-in databases (e.g. duckdb:/// in the benchmarks)
+        #keep their dialect's own pooling
+        engine = create_engine(url)
+    else:
+        connect_args = {}
+        if config.DB_STATEMENT_TIMEOUT_MS:
+            connect_args['options'] = f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}"
+        engine = create_engine(
+            url,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+            connect_args=connect_args,
+        )
+    _guard_against_fork(engine)
+    metrics.instrument_engine(engine)
+    return engine
+
+
+#a connection opened in the parent must never be used by a forked worker
+#record the pid on connect and invalidate the connection if it is checked
+#out in a different process
+def _guard_against_fork(engine):
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError(
+                f"connection record belongs to pid {connection_record.info['pid']}, "
+                f"attempting to check out in pid {pid}"
+            )
+
+
+#after a fork the child drops the parent's pooled connections
+#without closing them, the parent keeps using its own
+def _reset_after_fork():
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+#borrow a connection from the pool
+#it goes back to the pool as soon as the with block exits
+@contextmanager
+def connect():
+    started = time.perf_counter()
+    connection = get_engine().connect()
+    metrics.observe_pool_wait(time.perf_counter() - started)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+#close every pooled connection, e.g. on shutdown
+def dispose():
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+#current state of the pool, used to size DB_POOL_SIZE and DB_MAX_OVERFLOW
+def pool_stats():
+    pool = get_engine().pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': config.DB_MAX_OVERFLOW,
+    }
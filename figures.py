@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+#figure building for the dashboard's charts
+#plotly express resolves its arguments through a dataframe, builds a trace
+#per group and embeds the whole plotly_dark template (~7KB) in every figure,
+#after which each callback restyled it with the same update_layout block
+#here the dark/tomato styling is a small template built and registered once,
+#traces are graph objects made directly from the columns, and numeric arrays
+#are passed as numpy arrays, which plotly >= 6 sends as typed arrays (base64
+#of the raw buffer with its dtype) instead of json lists of numbers
+
+#color codes used by the charts
+TOMATO = '#FF6347'
+ORANGE = '#FFA500'
+ORANGE_RED = '#FF4500'
+TRANSPARENT = 'rgba(0,0,0,0)'
+
+TEMPLATE_NAME = 'dashboard'
+
+#only what the charts use: the page is dark, so the figures are transparent
+#with tomato text and no grid lines
+TEMPLATE = go.layout.Template(
+    layout=dict(
+        paper_bgcolor=TRANSPARENT,
+        plot_bgcolor=TRANSPARENT,
+        font=dict(color=TOMATO),
+        title=dict(font=dict(color=TOMATO), x=0.05),
+        legend=dict(font=dict(color=TOMATO), title=dict(font=dict(color=TOMATO))),
+        colorway=[TOMATO, ORANGE, ORANGE_RED],
+        hovermode='closest',
+        hoverlabel=dict(align='left'),
+        xaxis=dict(showgrid=False, linecolor='#506784', zerolinecolor='#283442', ticks='', automargin=True),
+        yaxis=dict(showgrid=False, linecolor='#506784', zerolinecolor='#283442', ticks='', automargin=True),
+    ),
+    data=dict(
+        pie=[go.Pie(automargin=True)],
+        bar=[go.Bar(marker=dict(line=dict(color='rgb(17,17,17)', width=0.5)))],
+    ),
+)
+pio.templates[TEMPLATE_NAME] = TEMPLATE
+
+#a numeric column as a numpy array, plotly >= 6 sends numpy arrays as
+#typed arrays, narrowing integers to the smallest type that holds them
+def numbers(values):
+    return np.asarray(values)
+
+
+#dates as iso strings in the coarsest unit that keeps them exact,
+#'2020-01-31' rather than '2020-01-31T00:00:00.000'
+def date_strings(values):
+    array = pd.to_datetime(pd.Series(values)).to_numpy(dtype='datetime64[ms]')
+    for unit in ('D', 'm', 's'):
+        coarse = array.astype(f'datetime64[{unit}]')
+        if (coarse == array).all():
+            return np.datetime_as_string(coarse).tolist()
+    return np.datetime_as_string(array).tolist()
+
+
+#category labels (e.g. years) as strings
+def labels(values):
+    return [str(value) for value in values]
+
+
+def _layout(title, **layout):
+    return go.Layout(template=TEMPLATE, title=dict(text=title), **layout)
+
+
+#repeat colors for every slice, the way plotly express cycles its sequence
+def _cycle(colors, n):
+    return [colors[i % len(colors)] for i in range(n)]
+
+
+#pie chart of values per label, a doughnut with `hole` and an optional
+#text in its center
+def pie(names, values, title, colors=(TOMATO, ORANGE), hole=None, center_text=None):
+    names = labels(names)
+    trace = go.Pie(
+        labels=names,
+        values=numbers(values),
+        hole=hole,
+        marker=dict(colors=_cycle(colors, len(names))),
+        sort=False,
+    )
+    annotations = []
+    if center_text:
+        annotations.append(dict(text=center_text, x=0.5, y=0.5, font=dict(size=20, color='white'), showarrow=False))
+    return go.Figure(data=[trace], layout=_layout(title, annotations=annotations))
+
+
+#one bar trace per column of `series` ({name: values}), grouped side by side
+def grouped_bar(x, series, title, colors=(TOMATO, ORANGE, ORANGE_RED), x_title=None, y_title='value', width=None):
+    traces = [
+        go.Bar(x=x, y=numbers(values), name=name, marker=dict(color=colors[i % len(colors)]), width=width)
+        for i, (name, values) in enumerate(series.items())
+    ]
+    return go.Figure(data=traces, layout=_layout(
+        title,
+        barmode='group',
+        xaxis=dict(title=dict(text=x_title)),
+        yaxis=dict(title=dict(text=y_title)),
+    ))
+
+
+#bars colored along an orange to tomato scale by their height
+def scaled_bar(x, y, title, x_title=None, y_title=None, colors=(ORANGE, TOMATO)):
+    y = numbers(y)
+    trace = go.Bar(
+        x=x,
+        y=y,
+        marker=dict(
+            color=y,
+            colorscale=[[0, colors[0]], [1, colors[1]]],
+            showscale=True,
+            colorbar=dict(title=dict(text=y_title), outlinewidth=0, ticks=''),
+        ),
+    )
+    return go.Figure(data=[trace], layout=_layout(
+        title,
+        xaxis=dict(title=dict(text=x_title)),
+        yaxis=dict(title=dict(text=y_title)),
+    ))
+
+
+#bars of one color, with explicit widths (in axis units) when given
+def bar(x, y, title, x_title=None, y_title=None, width=None, color=TOMATO):
+    trace = go.Bar(
+        x=x,
+        y=numbers(y),
+        width=None if width is None else numbers(width),
+        marker=dict(color=color),
+    )
+    return go.Figure(data=[trace], layout=_layout(
+        title,
+        xaxis=dict(title=dict(text=x_title)),
+        yaxis=dict(title=dict(text=y_title)),
+    ))
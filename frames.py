@@ -0,0 +1,158 @@
+import csv
+import datetime
+import decimal
+
+import pandas as pd
+
+import metrics
+from database import connect
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+#compact dataframes for query results
+#pd.read_sql fetches every row into a python tuple and hands pandas object
+#columns: sums of integers come back as Decimal, dates as datetime.date
+#here results are streamed off a server side cursor in batches, every batch
+#is turned into columns (arrow arrays when pyarrow is installed) and narrowed:
+#   integers and whole-number numerics -> int32 when they fit, else int64
+#   numerics with a fraction -> float64
+#   dates and timestamps -> datetime64
+#   text -> pyarrow backed strings (with pyarrow)
+#   year columns -> categorical
+
+#rows fetched from the cursor per batch
+BATCH_ROWS = 100_000
+
+#columns turned into categoricals by read_frame and to_frame
+CATEGORY_COLUMNS = ('year', 'years')
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+#decimal arrays become int64 when they have no scale, float64 otherwise
+def _arrow_column(values):
+    values = _plain(values)
+    array = pa.array(values, from_pandas=True)
+    if pa.types.is_decimal(array.type):
+        array = array.cast(pa.int64() if array.type.scale == 0 else pa.float64(), safe=False)
+    return array
+
+
+#psycopg2 returns bytea as memoryview, which neither arrow nor pickle take
+def _plain(values):
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, memoryview):
+        return [None if v is None else bytes(v) for v in values]
+    return values
+
+
+def _string_dtype(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+#one batch of rows into a frame, column by column
+def _batch_frame(rows, columns):
+    if pa is None:
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        for name in df.columns[df.dtypes == object]:
+            df[name] = _plain(df[name].tolist())
+        return df
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    table = pa.Table.from_arrays([_arrow_column(list(v)) for v in values], names=list(columns))
+    return table.to_pandas(date_as_object=False, types_mapper=_string_dtype)
+
+
+def _first_valid(series):
+    index = series.first_valid_index()
+    return None if index is None else series[index]
+
+
+#Decimal columns are whole numbers (sum of an integer, extract) or amounts
+def _from_decimal(series):
+    values = pd.to_numeric(series.astype(object), errors='coerce')
+    valid = values.dropna()
+    if series.isna().any() or not (valid == valid.round()).all():
+        return values.astype('float64')
+    return values.astype('int64')
+
+
+def _narrow_int(series):
+    if series.empty or (series.min() >= INT32_MIN and series.max() <= INT32_MAX):
+        return series.astype('int32')
+    return series
+
+
+#narrow the dtypes of a frame in place of the ones the driver gave it
+def compact(df, categories=CATEGORY_COLUMNS):
+    for name in df.columns:
+        series = df[name]
+        if series.dtype == object:
+            sample = _first_valid(series)
+            if isinstance(sample, decimal.Decimal):
+                series = _from_decimal(series)
+            elif isinstance(sample, (datetime.date, datetime.datetime)):
+                series = pd.to_datetime(series)
+            elif isinstance(sample, str) and pa is not None:
+                series = series.astype(pd.StringDtype('pyarrow'))
+        if pd.api.types.is_integer_dtype(series.dtype) and series.dtype.itemsize > 4:
+            series = _narrow_int(series)
+        if name in categories:
+            series = series.astype('category')
+        df[name] = series
+    return df
+
+
+#rows from any driver (e.g. asyncpg records) into a compact frame
+def to_frame(rows, columns, categories=CATEGORY_COLUMNS):
+    return compact(_batch_frame(rows, columns), categories)
+
+
+def _iter_batches(connection, query, params, batch_rows):
+    #options for this statement only, Connection.execution_options() would
+    #leave every later statement of the caller's transaction streaming
+    result = connection.execute(query, params or {}, execution_options={
+        'stream_results': True,
+        'max_row_buffer': batch_rows,
+    })
+    columns = list(result.keys())
+    empty = True
+    for rows in result.partitions(batch_rows):
+        empty = False
+        metrics.observe_rows(len(rows))
+        yield compact(_batch_frame(rows, columns), categories=())
+    if empty:
+        yield compact(_batch_frame([], columns), categories=())
+
+
+#stream a query as compact frames of at most batch_rows rows, for exports
+#and anything else that should not hold the whole result in memory
+#uses the given connection or borrows one from the pool
+def iter_frames(query, params=None, batch_rows=BATCH_ROWS, connection=None):
+    if connection is not None:
+        yield from _iter_batches(connection, query, params, batch_rows)
+        return
+    with connect() as connection:
+        yield from _iter_batches(connection, query, params, batch_rows)
+
+
+#drop in replacement for pd.read_sql returning a compact frame
+def read_frame(query, params=None, connection=None, categories=CATEGORY_COLUMNS):
+    batches = list(iter_frames(query, params, connection=connection))
+    df = batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+    return compact(df, categories)
+
+
+#write the result of a query to a csv file batch by batch
+#returns the number of rows written
+def export_csv(query, path, params=None, batch_rows=BATCH_ROWS):
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        for df in iter_frames(query, params, batch_rows):
+            df.to_csv(f, index=False, header=rows == 0, quoting=csv.QUOTE_MINIMAL)
+            rows += len(df)
+    return rows
@@ -0,0 +1,31 @@
+import multiprocessing
+
+#not `import config`, gunicorn reads `config` in here as one of its own settings
+import config as dashboard_config
+
+#gunicorn settings for serving the dashboard on every core
+#
+#   gunicorn            (picks up this file from the working directory)
+#
+#the app is imported once in the master (preload_app) and forked, the
+#workers then open their own database connections in post_fork
+
+wsgi_app = 'wsgi:server'
+bind = f"{dashboard_config.HOST}:{dashboard_config.PORT}"
+workers = dashboard_config.WEB_CONCURRENCY or multiprocessing.cpu_count()
+#callbacks mostly wait on the database, a few threads per worker overlap them
+threads = dashboard_config.WEB_THREADS
+preload_app = True
+#uploads are handed to background jobs, so no request should take this long
+timeout = 120
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.on_worker_start()
+
+
+def worker_exit(server, worker):
+    import wsgi
+    wsgi.on_worker_exit()
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+
+#server side histogram of transaction datetimes
+#plotly's histogram ships every timestamp to the browser and bins there,
+#here the timestamps are counted per chunk at a fixed resolution and only
+#the final bin edges and counts leave the server
+
+#most bins a histogram is drawn with
+MAX_BINS = 200
+
+#compact the per chunk counts once this many have piled up
+_MAX_PARTS = 16
+
+
+#mergeable datetime histogram, counts timestamps per `resolution` unit
+#(numpy datetime64 unit, minutes by default) and bins them on demand
+class DatetimeHistogram:
+
+    def __init__(self, resolution='m'):
+        self.resolution = resolution
+        self._parts = []
+
+    #add a batch of datetimes (Series, array or list), NaT is ignored
+    def update(self, values):
+        values = np.asarray(values, dtype='datetime64[ns]')
+        values = values[~np.isnat(values)]
+        if values.size == 0:
+            return
+        ticks = values.astype(f'datetime64[{self.resolution}]').astype('int64')
+        self._parts.append(np.unique(ticks, return_counts=True))
+        if len(self._parts) > _MAX_PARTS:
+            self._compact()
+
+    #fold another histogram with the same resolution into this one
+    def merge(self, other):
+        if other.resolution != self.resolution:
+            raise ValueError('cannot merge histograms with different resolutions')
+        self._parts.extend(other._parts)
+        self._compact()
+
+    def _compact(self):
+        if len(self._parts) <= 1:
+            return
+        ticks = np.concatenate([part[0] for part in self._parts])
+        counts = np.concatenate([part[1] for part in self._parts])
+        unique, inverse = np.unique(ticks, return_inverse=True)
+        self._parts = [(unique, np.bincount(inverse, weights=counts).astype('int64'))]
+
+    @property
+    def total(self):
+        return int(sum(part[1].sum() for part in self._parts))
+
+    #bin edges (datetime64, one more than counts) and counts per bin
+    def bins(self, max_bins=MAX_BINS):
+        self._compact()
+        if not self._parts:
+            return np.array([], dtype=f'datetime64[{self.resolution}]'), np.array([], dtype='int64')
+        ticks, counts = self._parts[0]
+        low, high = int(ticks[0]), int(ticks[-1]) + 1
+        n_bins = choose_bin_count(ticks, counts, max_bins)
+        #integer edges so every bin covers whole resolution units
+        edges = np.unique(np.linspace(low, high, n_bins + 1).round().astype('int64'))
+        hist, _ = np.histogram(ticks, bins=edges, weights=counts)
+        return edges.astype(f'datetime64[{self.resolution}]'), hist.astype('int64')
+
+
+#number of bins for weighted data, numpy's 'auto' rule:
+#the larger of the sturges and freedman-diaconis estimates, capped at max_bins
+#and at one bin per resolution unit
+def choose_bin_count(ticks, counts, max_bins=MAX_BINS):
+    n = int(counts.sum())
+    span = int(ticks[-1]) - int(ticks[0]) + 1
+    if n <= 1 or span <= 1:
+        return 1
+    sturges = math.ceil(math.log2(n)) + 1
+    cumulative = np.cumsum(counts)
+    q25 = ticks[np.searchsorted(cumulative, 0.25 * n)]
+    q75 = ticks[np.searchsorted(cumulative, 0.75 * n)]
+    width = 2 * (int(q75) - int(q25)) / n ** (1 / 3)
+    fd = math.ceil(span / width) if width > 0 else 0
+    return max(1, min(max(sturges, fd), max_bins, span))
@@ -0,0 +1,166 @@
+import base64
+import binascii
+import io
+
+import pandas as pd
+
+from bulk_load import load_chunks
+from histogram import DatetimeHistogram
+from stats import FrameStats
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+#streaming ingest for uploaded csv files
+#dash hands us the upload as one `data:<type>;base64,<payload>` string
+#instead of decoding it all at once we decode and parse it a chunk at a time
+#so peak memory stays roughly constant whatever the size of the file
+
+#rows parsed and written per chunk
+CHUNK_ROWS = 50000
+
+#base64 characters decoded per read, a multiple of 4
+DECODE_BLOCK = 4 * 256 * 1024
+
+#explicit dtypes so pandas does not have to infer (and re-infer) per chunk
+CSV_DTYPES = {
+    'transaction_id': 'string',
+    'customer_id': 'string',
+    'sent_amount': 'float64',
+    'received_amount': 'float64',
+    'balance_then': 'float64',
+}
+
+
+#file-like object that decodes the base64 payload of an upload lazily
+#contents is the dash upload string, or any str/bytes-like object that can be
+#sliced (e.g. an mmap of a spooled payload), with or without the data: header
+class Base64Reader(io.RawIOBase):
+
+    def __init__(self, contents, block=DECODE_BLOCK):
+        #skip the `data:<type>;base64,` header without copying the payload
+        self._contents = contents
+        header = contents[:5]
+        if isinstance(header, str):
+            self._pos = contents.index(',') + 1 if header == 'data:' else 0
+        else:
+            self._pos = contents.find(b',') + 1 if header == b'data:' else 0
+        self._block = block
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and self._pos < len(self._contents):
+            end = min(self._pos + self._block, len(self._contents))
+            try:
+                self._pending = base64.b64decode(self._contents[self._pos:end])
+            except binascii.Error as e:
+                raise ValueError('upload is not valid base64') from e
+            self._pos = end
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def _read_csv(stream, chunk_rows):
+    reader = pd.read_csv(stream, chunksize=chunk_rows, dtype=CSV_DTYPES)
+    for chunk in reader:
+        if 'transaction_datetime' in chunk:
+            chunk['transaction_datetime'] = pd.to_datetime(chunk['transaction_datetime'])
+        yield chunk
+
+
+#yield the upload as DataFrames of at most chunk_rows rows
+def iter_csv_chunks(contents, chunk_rows=CHUNK_ROWS):
+    raw = io.BufferedReader(Base64Reader(contents))
+    stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    yield from _read_csv(stream, chunk_rows)
+
+
+#the same for a csv file on disk
+def iter_csv_file(path, chunk_rows=CHUNK_ROWS):
+    with open(path, encoding='utf-8', newline='') as stream:
+        yield from _read_csv(stream, chunk_rows)
+
+
+#column names the way read_excel gives them: blanks become `Unnamed: <i>`
+#and repeated names get a `.1`, `.2`... suffix (e.g. `user_id.1` of a join)
+def _excel_columns(header):
+    columns = []
+    seen = {}
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+#yield a sheet of an excel workbook (the first by default) as DataFrames
+#of at most chunk_rows rows, read_only mode streams the rows off the file
+#instead of building the whole workbook in memory like read_excel does
+def iter_excel_file(path, chunk_rows=CHUNK_ROWS, sheet=None):
+    if openpyxl is None:
+        raise RuntimeError('reading excel files needs openpyxl')
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _excel_columns(header)
+        batch = []
+        for row in rows:
+            #read_only sheets often end in empty rows
+            if all(value is None for value in row):
+                continue
+            #rows and the header can be ragged when trailing cells are empty
+            if len(row) > len(columns):
+                header = tuple(header) + (None,) * (len(row) - len(header))
+                columns = _excel_columns(header)
+            batch.append(tuple(row) + (None,) * (len(columns) - len(row)))
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+#mergeable per chunk summary of an upload
+#one pass statistics per numeric column and a histogram of
+#transaction_datetime, enough for the summary panel and the upload chart
+class UploadSummary:
+
+    def __init__(self):
+        self.rows = 0
+        self.stats = FrameStats()
+        self.histogram = DatetimeHistogram()
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        self.stats.update(chunk)
+        if 'transaction_datetime' in chunk:
+            self.histogram.update(chunk['transaction_datetime'])
+
+    #statistics per column in the same shape as df.describe().to_dict()
+    def to_dict(self):
+        return self.stats.to_dict()
+
+
+#stream an upload into the database chunk by chunk
+#chunks are bulk copied into staging and merged into the table in one transaction
+def load_upload(contents, table='test_data', chunk_rows=CHUNK_ROWS):
+    summary = UploadSummary()
+    report = load_chunks(iter_csv_chunks(contents, chunk_rows), table=table, on_chunk=summary.update)
+    return summary, report
@@ -0,0 +1,205 @@
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+import figures
+import paths
+import rollups
+import snapshot
+import versions
+from bulk_load import load_chunks
+from ingest import UploadSummary, iter_csv_chunks
+
+#background processing for uploads
+#the upload callback only spools the payload to disk and hands it to a
+#process pool, the dashboard polls the job's status file for progress
+#every job lives in its own directory under JOBS_DIR:
+#   payload.b64   the base64 payload of the upload
+#   status.json   stage, rows parsed and loaded, message
+#   result.json   status line, summary text and figure once it is done
+#   cancel        present when the user asked to cancel
+
+_executor = None
+_futures = {}
+
+#stages a job moves through
+QUEUED = 'queued'
+LOADING = 'loading'
+MERGING = 'merging'
+ROLLUPS = 'updating rollups'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+#one pool per process, created on first use
+#spawned workers so they never inherit the dashboard's threads or connections
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=config.UPLOAD_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+#ids are uuid4().hex as submit_upload makes them
+#they come back from the browser, so anything else is refused before it
+#becomes part of a path the job functions write to or delete
+def is_job_id(job_id):
+    return isinstance(job_id, str) and re.fullmatch('[0-9a-f]{32}', job_id) is not None
+
+
+def _job_dir(job_id):
+    if not is_job_id(job_id):
+        raise ValueError(f"not an upload job id: {job_id!r}")
+    return os.path.join(paths.private_dir(config.JOBS_DIR), job_id)
+
+
+#write json next to the target and rename it so readers never see half a file
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _set_status(job_dir, **status):
+    path = os.path.join(job_dir, 'status.json')
+    current = _read_json(path) or {}
+    current.update(status)
+    _write_json(path, current)
+
+
+#spool an upload to disk and queue it, returns the job id
+def submit_upload(contents, filename=None):
+    job_id = uuid.uuid4().hex
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir)
+    #keep only the payload, the worker decodes it straight from the file
+    with open(os.path.join(job_dir, 'payload.b64'), 'w') as f:
+        f.write(contents[contents.index(',') + 1:] if contents.startswith('data:') else contents)
+    _set_status(job_dir, stage=QUEUED, filename=filename, rows_parsed=0, rows_loaded=0, message='')
+    _futures[job_id] = _get_executor().submit(run_upload, job_dir)
+    return job_id
+
+
+#progress of a job, None for an unknown job
+def job_status(job_id):
+    return _read_json(os.path.join(_job_dir(job_id), 'status.json'))
+
+
+#status line, summary text and figure of a finished job
+def job_result(job_id):
+    return _read_json(os.path.join(_job_dir(job_id), 'result.json'))
+
+
+#ask a job to stop, a queued job never starts and a running one rolls back
+#unless its load and rollup refresh have already committed
+def cancel(job_id):
+    job_dir = _job_dir(job_id)
+    open(os.path.join(job_dir, 'cancel'), 'w').close()
+    future = _futures.pop(job_id, None)
+    if future is not None and future.cancel():
+        _set_status(job_dir, stage=CANCELLED, message='Upload cancelled.')
+
+
+#format the upload summary for the summary panel
+def format_summary(summary):
+    summary_str = ''
+    for col, stats in summary.to_dict().items():
+        summary_str += f"{col.capitalize()} Statistics:\n"
+        for stat, value in stats.items():
+            summary_str += f"{stat.capitalize()}: {value}\n"
+        summary_str += "\n"
+    return summary_str
+
+
+#histogram of transaction times, binned on the server while the file was streamed in
+#only the bins are sent to the browser, not every timestamp
+def upload_figure(histogram):
+    edges, counts = histogram.bins()
+    widths = np.diff(edges).astype('timedelta64[ms]').astype('int64')
+    return figures.bar(figures.date_strings(edges[:-1] + np.diff(edges) / 2), counts, 'Transactions over Time',
+                       x_title='transaction_datetime', y_title='count', width=widths)
+
+
+#runs in a worker process: parse, load, refresh the rollups and build the result
+#the rollups are refreshed in the load's transaction, so a cancel seen at any
+#point before it commits leaves neither the rows nor the rollups behind
+def run_upload(job_dir):
+    cancel_path = os.path.join(job_dir, 'cancel')
+    payload_path = os.path.join(job_dir, 'payload.b64')
+    summary = UploadSummary()
+
+    def check_cancelled():
+        if os.path.exists(cancel_path):
+            raise JobCancelled()
+
+    def on_chunk(chunk):
+        summary.update(chunk)
+        _set_status(job_dir, rows_parsed=summary.rows)
+        check_cancelled()
+
+    def on_merge(connection, report):
+        check_cancelled()
+        _set_status(job_dir, stage=ROLLUPS, rows_loaded=report.inserted + report.updated)
+        rollups.refresh_days(connection, report.first_datetime, report.last_datetime)
+        check_cancelled()
+
+    def chunks(payload):
+        yield from iter_csv_chunks(payload)
+        _set_status(job_dir, stage=MERGING)
+
+    try:
+        check_cancelled()
+        _set_status(job_dir, stage=LOADING)
+        with open(payload_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError('the uploaded file is empty')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as payload:
+                report = load_chunks(chunks(payload), on_chunk=on_chunk, on_merge=on_merge)
+        snapshot.refresh_range(report.first_datetime, report.last_datetime)
+        versions.bump()
+        _write_json(os.path.join(job_dir, 'result.json'), {
+            'status': f'Data loaded and stored successfully. {report}',
+            'summary': format_summary(summary),
+            'figure': json.loads(upload_figure(summary.histogram).to_json()),
+        })
+        _set_status(job_dir, stage=DONE, message=str(report))
+    except JobCancelled:
+        _set_status(job_dir, stage=CANCELLED, message='Upload cancelled, nothing was stored.')
+    except Exception as e:
+        _set_status(job_dir, stage=FAILED, message=f'Upload failed: {e}')
+    finally:
+        if os.path.exists(payload_path):
+            os.remove(payload_path)
+
+
+#remove a job's directory once its result has been shown
+def forget(job_id):
+    _futures.pop(job_id, None)
+    shutil.rmtree(_job_dir(job_id), ignore_errors=True)
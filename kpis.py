@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+import config
+import sketches
+from cache import read_cached
+
+#all the headline numbers on the dashboard come from one scan of test_data
+#the old per-kpi queries each did their own full scan and most of them
+#had a `transaction_id in (select distinct transaction_id ...)` semi-join
+#which matches every row anyway, so it is dropped here
+KPI_QUERY = text(
+    '''
+    select
+        count(distinct customer_id) as total_customers,
+        count(distinct transaction_id) as total_transactions,
+        coalesce(sum(sent_amount), 0) as amount_sent,
+        coalesce(sum(received_amount), 0) as amount_received,
+        coalesce(sum((received_amount + balance_then) - sent_amount), 0) as net_balance
+    from test_data
+    '''
+)
+
+#the sums for the fast mode, read from the daily rollups
+#the distinct counts come from merging the per day sketches
+TOTALS_QUERY = text(
+    '''
+    select
+        coalesce(sum(sent), 0) as amount_sent,
+        coalesce(sum(received), 0) as amount_received,
+        coalesce(sum(net_balance), 0) as net_balance
+    from daily_rollup
+    '''
+)
+
+EXACT = 'exact'
+FAST = 'fast'
+
+
+#typed result for the kpi cards
+@dataclass(frozen=True)
+class KpiSummary:
+    total_customers: int = 0
+    total_transactions: int = 0
+    amount_sent: float = 0.0
+    amount_received: float = 0.0
+    net_balance: float = 0.0
+
+    #build the summary from the single row returned by KPI_QUERY
+    @classmethod
+    def from_frame(cls, df):
+        if df.empty:
+            return cls()
+        row = df.iloc[0]
+        return cls(
+            total_customers=int(row['total_customers'] or 0),
+            total_transactions=int(row['total_transactions'] or 0),
+            amount_sent=float(row['amount_sent'] or 0),
+            amount_received=float(row['amount_received'] or 0),
+            net_balance=float(row['net_balance'] or 0),
+        )
+
+    #the values in the order the kpi cards are laid out
+    def as_cards(self):
+        return (
+            self.total_customers,
+            self.total_transactions,
+            f"KSH {self.amount_sent:.1f}",
+            f"KSH {self.amount_received:.1f}",
+            f"KSH {self.net_balance:.1f}",
+        )
+
+
+#the (query, params) pairs fetch_kpis reads in a mode, for prefetching
+def kpi_queries(mode=None):
+    if (mode or config.KPI_MODE) == FAST:
+        return [(TOTALS_QUERY, None), sketches.sketch_query()]
+    return [(KPI_QUERY, None)]
+
+
+#run the kpi query once and return every headline metric
+#in fast mode the distinct counts are HyperLogLog estimates, see config.HLL_PRECISION
+def fetch_kpis(mode=None):
+    mode = mode or config.KPI_MODE
+    if mode == EXACT:
+        df = read_cached(KPI_QUERY)
+        return KpiSummary.from_frame(df)
+    if mode != FAST:
+        raise ValueError(f"unknown kpi mode {mode!r}, expected {EXACT!r} or {FAST!r}")
+    df = read_cached(TOTALS_QUERY)
+    customers, transactions = sketches.distinct_counts()
+    df = df.assign(total_customers=customers, total_transactions=transactions)
+    return KpiSummary.from_frame(df)
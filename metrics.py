@@ -0,0 +1,210 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+import config
+
+#instrumentation for the dash callbacks
+#every instrumented callback records its wall time, the time and rows of the
+#sql it ran, the time spent building its figure (wall time minus data reads)
+#and the size of its response, exposed in prometheus text format on /metrics
+#metrics are per process, with several workers each one reports its own
+
+logger = logging.getLogger('dashboard.slow_callbacks')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+#prometheus histogram with one label
+class Histogram:
+
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.setdefault(label_value, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for label_value, (counts, total, count) in sorted(series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+CALLBACK_SECONDS = Histogram('dashboard_callback_seconds', 'Wall time of a callback.', 'callback', LATENCY_BUCKETS)
+SQL_SECONDS = Histogram('dashboard_callback_sql_seconds', 'Time a callback spent executing sql.', 'callback', LATENCY_BUCKETS)
+ROWS_FETCHED = Histogram('dashboard_callback_rows_fetched', 'Rows a callback fetched from the database.', 'callback', ROW_BUCKETS)
+FIGURE_SECONDS = Histogram('dashboard_callback_figure_seconds', 'Time a callback spent after its data reads, building its output.', 'callback', LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram('dashboard_callback_response_bytes', 'Size of a callback response sent to the browser.', 'callback', BYTE_BUCKETS)
+POOL_WAIT_SECONDS = Histogram('dashboard_pool_wait_seconds', 'Time spent waiting for a pooled connection.', 'pool', LATENCY_BUCKETS)
+
+HISTOGRAMS = (CALLBACK_SECONDS, SQL_SECONDS, ROWS_FETCHED, FIGURE_SECONDS, RESPONSE_BYTES, POOL_WAIT_SECONDS)
+
+
+#what the running callback has done so far
+class _CallbackStats:
+
+    def __init__(self, name):
+        self.name = name
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.data_seconds = 0.0
+        self.statements = []
+
+
+_current = contextvars.ContextVar('dashboard_callback', default=None)
+
+
+#decorator for dash callbacks, put it below @callback
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _CallbackStats(func.__name__)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            wall = time.perf_counter() - started
+            _current.reset(token)
+            CALLBACK_SECONDS.observe(stats.name, wall)
+            SQL_SECONDS.observe(stats.name, stats.sql_seconds)
+            ROWS_FETCHED.observe(stats.name, stats.rows)
+            FIGURE_SECONDS.observe(stats.name, max(wall - stats.data_seconds, 0.0))
+            if config.SLOW_CALLBACK_MS and wall * 1000 >= config.SLOW_CALLBACK_MS:
+                logger.warning('slow callback %s took %.0f ms (%.0f ms sql, %d rows): %s',
+                               stats.name, wall * 1000, stats.sql_seconds * 1000, stats.rows,
+                               ' ;; '.join(' '.join(s.split()) for s in stats.statements) or 'no queries')
+    return wrapper
+
+
+#record sql run on behalf of the current callback
+def observe_sql(seconds, statement=None):
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.sql_seconds += seconds
+    if statement is not None and config.SLOW_CALLBACK_MS:
+        stats.statements.append(str(statement))
+
+
+#record rows fetched on behalf of the current callback
+#counted where the frames are built, streamed cursors report no rowcount
+def observe_rows(rows):
+    stats = _current.get()
+    if stats is not None:
+        stats.rows += rows
+
+
+#time spent reading data (cache lookups and sql), the rest is figure building
+class data_read:
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stats = _current.get()
+        if stats is not None:
+            stats.data_seconds += time.perf_counter() - self._started
+
+
+def observe_pool_wait(seconds, pool='sync'):
+    POOL_WAIT_SECONDS.observe(pool, seconds)
+
+
+#time every statement the engine runs
+#the start time lives on the statement's execution context, a statement that
+#fails never reaches after_cursor_execute and must not leave it behind on
+#the pooled connection for the next statement to pick up
+def instrument_engine(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is not None:
+            observe_sql(time.perf_counter() - started, statement)
+
+
+def _counter(name, help, value):
+    return [f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {value}"]
+
+
+def _gauge(name, help, value):
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+#everything in prometheus text exposition format
+def render():
+    import cache
+    import database
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    stats = cache.cache_stats()
+    lines.extend(_counter('dashboard_cache_hits_total', 'Result cache hits in this process.', stats['hits']))
+    lines.extend(_counter('dashboard_cache_misses_total', 'Result cache misses in this process.', stats['misses']))
+    lines.extend(_counter('dashboard_cache_evictions_total', 'Result cache evictions in this process.', stats['evictions']))
+    lines.extend(_counter('dashboard_cache_prefetched_total', 'Results fetched into the cache ahead of the callbacks.', stats['prefetched']))
+    lines.extend(_gauge('dashboard_cache_bytes', 'Bytes held by the shared result cache.', stats['bytes']))
+    for key, value in database.pool_stats().items():
+        lines.extend(_gauge(f'dashboard_pool_{key}', f'Connection pool {key.replace("_", " ")}.', value))
+    return '\n'.join(lines) + '\n'
+
+
+#name of the callback that produces a dash output, for the response size metric
+def _callback_name(app, output):
+    entry = app.callback_map.get(output)
+    func = entry and entry.get('callback')
+    return getattr(func, '__name__', output)
+
+
+#add /metrics to the flask server and measure every callback response
+def init_app(app):
+    server = app.server
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+        return render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    @server.after_request
+    def record_response_size(response):
+        from flask import request
+        if request.path.endswith('/_dash-update-component') and response.status_code == 200:
+            try:
+                output = json.loads(request.get_data())['output']
+            except (ValueError, KeyError, TypeError):
+                output = 'unknown'
+            RESPONSE_BYTES.observe(_callback_name(app, output), response.calculate_content_length() or 0)
+        return response
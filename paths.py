@@ -0,0 +1,37 @@
+import os
+
+#private directories for the files the dashboard trusts
+#the result cache holds pickled frames, upload jobs keep their status and
+#results and the parquet snapshot answers dashboard queries, so each lives in
+#a directory created with mode 0700 that nobody else may own or write to,
+#and a file in it that belongs to another user is refused
+
+
+class UnsafePath(RuntimeError):
+    pass
+
+
+#create directory (mode 0700) if it is missing and make sure it is ours and
+#not writable by anyone else, returns the directory
+def private_dir(directory):
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        uid = os.getuid()
+        info = os.stat(directory)
+        if info.st_uid != uid or info.st_mode & 0o022:
+            raise UnsafePath(f"{directory} must be owned by uid {uid} and not writable by others")
+    return directory
+
+
+#refuse any of the files that exists and belongs to another user
+def check_owner(*files):
+    if not hasattr(os, 'getuid'):
+        return
+    uid = os.getuid()
+    for path in files:
+        try:
+            owner = os.stat(path).st_uid
+        except FileNotFoundError:
+            continue
+        if owner != uid:
+            raise UnsafePath(f"{path} is owned by uid {owner}, not {uid}")
@@ -0,0 +1,255 @@
+import pandas as pd
+from sqlalchemy import text
+
+import customers
+import sketches
+import snapshot
+from cache import read_cached
+from database import get_engine
+from schema import lock_writers
+
+#day grain aggregates of test_data
+#the charts read these instead of re-aggregating every transaction,
+#so their cost depends on the number of days, not the number of rows
+#loads keep them current by recomputing only the days they touched
+#the distinct count sketches in sketches.py and the per customer features
+#in customers.py are maintained alongside, and the parquet snapshot is
+#brought up to date once they have committed
+
+CREATE_DAILY_ROLLUP = text(
+    '''
+    create table if not exists daily_rollup (
+        day date primary key,
+        transactions bigint not null,
+        sent numeric not null,
+        received numeric not null,
+        net_balance numeric not null
+    )
+    '''
+)
+
+#drop the days about to be recomputed so days that lost all their rows disappear
+DELETE_DAYS = text(
+    '''
+    delete from daily_rollup
+    where day >= :start_day and day <= :end_day
+    '''
+)
+
+#recompute the given days from the fact table
+#transactions are counted distinct per day, the sums cover every row
+INSERT_DAYS = text(
+    '''
+    insert into daily_rollup (day, transactions, sent, received, net_balance)
+    select
+        date_trunc('day', transaction_datetime)::date as day,
+        count(distinct transaction_id) as transactions,
+        coalesce(sum(sent_amount), 0) as sent,
+        coalesce(sum(received_amount), 0) as received,
+        coalesce(sum((received_amount + balance_then) - sent_amount), 0) as net_balance
+    from test_data
+    where transaction_datetime >= :start_day
+      and transaction_datetime < cast(:end_day as date) + 1
+    group by 1
+    '''
+)
+
+REBUILD_ALL = text(
+    '''
+    insert into daily_rollup (day, transactions, sent, received, net_balance)
+    select
+        date_trunc('day', transaction_datetime)::date as day,
+        count(distinct transaction_id) as transactions,
+        coalesce(sum(sent_amount), 0) as sent,
+        coalesce(sum(received_amount), 0) as received,
+        coalesce(sum((received_amount + balance_then) - sent_amount), 0) as net_balance
+    from test_data
+    where transaction_datetime is not null
+    group by 1
+    '''
+)
+
+#the years that have data, for the year dropdown
+#reads the rollups so it never touches the fact table
+YEARS = text(
+    '''
+    select distinct
+        extract(year from day)::int as years
+    from daily_rollup
+    order by years
+    '''
+)
+
+#queries used by the chart callbacks
+TRANSACTIONS_PER_YEAR = text(
+    '''
+    select
+        sum(transactions) as transactions,
+        extract(year from day) as year
+    from daily_rollup
+    group by year
+    order by year
+    '''
+)
+
+#transactions per day, week, month, quarter or year within a date range
+#the grain is validated against GRAINS before it is bound
+TRANSACTIONS_PER_PERIOD = text(
+    '''
+    select
+        sum(transactions) as transactions,
+        date_trunc(:grain, day)::date as transaction_date
+    from daily_rollup
+    where day >= :start_day and day <= :end_day
+    group by 2
+    order by 2
+    '''
+)
+
+DATE_RANGE = text(
+    '''
+    select
+        min(day) as first_day,
+        max(day) as last_day
+    from daily_rollup
+    '''
+)
+
+SENT_PER_YEAR = text(
+    '''
+    select
+        sum(sent) as sent,
+        extract(year from day) as year
+    from daily_rollup
+    group by year
+    order by year
+    '''
+)
+
+RECEIVED_PER_YEAR = text(
+    '''
+    select
+        sum(received) as received,
+        extract(year from day) as year
+    from daily_rollup
+    group by year
+    order by year
+    '''
+)
+
+NET_BALANCE_PER_YEAR = text(
+    '''
+    select
+        sum(net_balance) as balance,
+        extract(year from day) as year
+    from daily_rollup
+    group by year
+    order by year
+    '''
+)
+
+AMOUNTS_PER_MONTH = text(
+    '''
+    select
+        sum(received) as received,
+        sum(sent) as sent,
+        sum(net_balance) as balance,
+        extract(year from day) as years,
+        extract(month from day) as month
+    from daily_rollup
+    group by month, years
+    order by month desc
+    '''
+)
+
+#the same for one year, the range on day lets postgres use the primary key
+AMOUNTS_PER_MONTH_FOR_YEAR = text(
+    '''
+    select
+        sum(received) as received,
+        sum(sent) as sent,
+        sum(net_balance) as balance,
+        extract(year from day) as years,
+        extract(month from day) as month
+    from daily_rollup
+    where day >= make_date(:year, 1, 1)
+      and day < make_date(:year + 1, 1, 1)
+    group by month, years
+    order by month desc
+    '''
+)
+
+
+#approximate length in days of each grain the date chart can use, finest first
+GRAINS = (
+    ('day', 1),
+    ('week', 7),
+    ('month', 30),
+    ('quarter', 91),
+    ('year', 365),
+)
+
+
+#the finest grain that keeps the number of points between start and end under max_points
+def choose_grain(start, end, max_points):
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for grain, days in GRAINS:
+        if span / days <= max_points:
+            return grain
+    return GRAINS[-1][0]
+
+
+#create the rollup table if it does not exist yet
+def ensure_rollups(connection):
+    connection.execute(CREATE_DAILY_ROLLUP)
+
+
+#recompute the rollups for every day between start and end (inclusive)
+#runs inside the caller's transaction, after the other writers of test_data
+#have committed, two refreshes of the same days would both delete and then
+#both insert them
+def refresh_days(connection, start, end):
+    if start is None or end is None or pd.isna(start) or pd.isna(end):
+        return
+    lock_writers(connection)
+    params = {
+        'start_day': pd.Timestamp(start).date(),
+        'end_day': pd.Timestamp(end).date(),
+    }
+    ensure_rollups(connection)
+    connection.execute(DELETE_DAYS, params)
+    connection.execute(INSERT_DAYS, params)
+    sketches.refresh_days(connection, start, end)
+    customers.refresh_days(connection, start, end)
+
+
+#recompute the rollups for every day between start and end in its own transaction
+def refresh_range(start, end):
+    with get_engine().begin() as connection:
+        refresh_days(connection, start, end)
+    snapshot.refresh_range(start, end)
+
+
+#throw the rollups away and rebuild them from the whole fact table
+#only needed once to backfill, loads keep them current afterwards
+def rebuild():
+    with get_engine().begin() as connection:
+        lock_writers(connection)
+        ensure_rollups(connection)
+        connection.execute(text('truncate daily_rollup'))
+        connection.execute(REBUILD_ALL)
+        sketches.rebuild(connection)
+        customers.rebuild(connection)
+    if snapshot.enabled():
+        snapshot.rebuild()
+
+
+#read one of the chart queries above, through the result cache
+def read_rollup(query, params=None):
+    return read_cached(query, params=params)
+
+
+if __name__ == "__main__":
+    import versions
+    rebuild()
+    versions.bump()
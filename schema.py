@@ -0,0 +1,169 @@
+import pandas as pd
+from sqlalchemy import text
+
+import config
+from database import get_engine
+
+#schema management for the transaction table
+#test_data is range partitioned on transaction_datetime so queries filtered
+#on a year or month only scan the matching partitions, and it carries the
+#indexes every dashboard and load query filters or groups on
+#partitions are attached by the loader before rows for a new period land
+
+#a unique index on a partitioned table has to include the partition key
+CONFLICT_COLUMNS = ['transaction_id', 'transaction_datetime']
+
+CREATE_TABLE = '''
+    create table if not exists {table} (
+        transaction_id text not null,
+        customer_id text,
+        transaction_datetime timestamp not null,
+        sent_amount double precision,
+        received_amount double precision,
+        balance_then double precision
+    ) partition by range (transaction_datetime)
+'''
+
+#indexes created on the parent cascade to every partition, by name
+CREATE_INDEXES = (
+    ('{table}_transaction_key', '''
+    create unique index if not exists {table}_transaction_key
+    on {table} (transaction_id, transaction_datetime)
+    '''),
+    ('{table}_transaction_datetime_idx', '''
+    create index if not exists {table}_transaction_datetime_idx
+    on {table} (transaction_datetime)
+    '''),
+    ('{table}_customer_id_idx', '''
+    create index if not exists {table}_customer_id_idx
+    on {table} (customer_id)
+    '''),
+)
+
+CREATE_PARTITION = '''
+    create table if not exists {partition}
+    partition of {table}
+    for values from ('{start}') to ('{end}')
+'''
+
+#which of the named tables and indexes exist
+EXISTING = text(
+    '''
+    select c.relname
+    from pg_class c
+    join pg_namespace n on n.oid = c.relnamespace
+    where c.relname = any(:names) and n.nspname = current_schema()
+    '''
+)
+
+#one writer at a time for a table and the tables derived from it
+#an advisory lock held until the transaction ends
+LOCK_WRITERS = text('select pg_advisory_xact_lock(hashtext(:key))')
+
+#relkind 'p' is a partitioned table, 'r' an ordinary one
+TABLE_KIND = text(
+    '''
+    select c.relkind
+    from pg_class c
+    join pg_namespace n on n.oid = c.relnamespace
+    where c.relname = :table and n.nspname = current_schema()
+    '''
+)
+
+
+#start and end of every partition period between start and end (inclusive)
+def partition_bounds(start, end, grain=None):
+    grain = grain or config.PARTITION_GRAIN
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if grain == 'year':
+        period_start, step = pd.Timestamp(start.year, 1, 1), pd.DateOffset(years=1)
+    else:
+        period_start, step = pd.Timestamp(start.year, start.month, 1), pd.DateOffset(months=1)
+    while period_start <= end:
+        yield period_start, period_start + step
+        period_start = period_start + step
+
+
+def partition_name(table, period_start, grain=None):
+    grain = grain or config.PARTITION_GRAIN
+    if grain == 'year':
+        return f"{table}_y{period_start:%Y}"
+    return f"{table}_y{period_start:%Y}m{period_start:%m}"
+
+
+def _existing(connection, names):
+    return set(connection.execute(EXISTING, {'names': list(names)}).scalars())
+
+
+#wait for the other writers of table to commit and keep them out until this
+#transaction ends, loads and rollup refreshes take it before they write
+def lock_writers(connection, table='test_data'):
+    connection.execute(LOCK_WRITERS, {'key': f"writers:{table}"})
+
+
+#create the partitioned table and its indexes if they are missing
+#the catalog is checked first, `create index if not exists` takes a lock
+#that blocks writers before it finds out the index is already there
+def ensure_schema(connection, table='test_data'):
+    indexes = [(name.format(table=table), statement) for name, statement in CREATE_INDEXES]
+    existing = _existing(connection, [table] + [name for name, _ in indexes])
+    if table not in existing:
+        connection.execute(text(CREATE_TABLE.format(table=table)))
+    for name, statement in indexes:
+        if name not in existing:
+            connection.execute(text(statement.format(table=table)))
+
+
+#attach a partition for every period between start and end that has none
+#creating one locks the whole table, only missing ones are created
+def ensure_partitions(connection, start, end, table='test_data'):
+    if start is None or end is None or pd.isna(start) or pd.isna(end):
+        return
+    periods = list(partition_bounds(start, end))
+    existing = _existing(connection, [partition_name(table, period_start) for period_start, _ in periods])
+    for period_start, period_end in periods:
+        if partition_name(table, period_start) in existing:
+            continue
+        connection.execute(text(CREATE_PARTITION.format(
+            partition=partition_name(table, period_start),
+            table=table,
+            start=f"{period_start:%Y-%m-%d}",
+            end=f"{period_end:%Y-%m-%d}",
+        )))
+
+
+#move an existing unpartitioned test_data (e.g. created by to_sql in the
+#notebook) into the partitioned layout, keeping one row per transaction key
+#the old table is kept as test_data_unpartitioned until it is dropped by hand
+def migrate(table='test_data'):
+    legacy = f"{table}_unpartitioned"
+    with get_engine().begin() as connection:
+        connection.execute(text('set local statement_timeout = 0'))
+        lock_writers(connection, table)
+        kind = connection.execute(TABLE_KIND, {'table': table}).scalar()
+        if kind == 'r':
+            connection.execute(text(f"alter table {table} rename to {legacy}"))
+        ensure_schema(connection, table)
+        if kind != 'r':
+            return
+        low, high = connection.execute(text(
+            f"select min(transaction_datetime), max(transaction_datetime) from {legacy}"
+        )).one()
+        ensure_partitions(connection, low, high, table)
+        connection.execute(text(
+            f'''
+            insert into {table} (transaction_id, customer_id, transaction_datetime,
+                                 sent_amount, received_amount, balance_then)
+            select distinct on (transaction_id::text, transaction_datetime)
+                transaction_id::text, customer_id::text, transaction_datetime,
+                sent_amount, received_amount, balance_then
+            from {legacy}
+            where transaction_id is not null and transaction_datetime is not null
+            '''
+        ))
+
+
+if __name__ == "__main__":
+    import versions
+    migrate()
+    versions.bump()
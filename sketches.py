@@ -0,0 +1,300 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+import config
+from cache import read_cached
+from frames import iter_frames
+from schema import lock_writers
+
+#per day HyperLogLog sketches of the distinct customers and transactions
+#count(distinct ...) over test_data is a full sort or hash of every row,
+#a sketch is a few kilobytes per day and sketches merge by taking the
+#register wise max, so the distinct count of any range of days comes from
+#merging that many sketches instead of rescanning the transactions
+#the sketches are maintained next to the rollups (see rollups.refresh_days)
+
+CREATE_DAILY_SKETCHES = text(
+    '''
+    create table if not exists daily_sketches (
+        day date primary key,
+        precision smallint not null,
+        customers bytea not null,
+        transactions bytea not null
+    )
+    '''
+)
+
+DELETE_DAYS = text(
+    '''
+    delete from daily_sketches
+    where day >= :start_day and day <= :end_day
+    '''
+)
+
+INSERT_DAY = text(
+    '''
+    insert into daily_sketches (day, precision, customers, transactions)
+    values (:day, :precision, :customers, :transactions)
+    '''
+)
+
+#the ids of the days to sketch, streamed in batches
+DAY_IDS = text(
+    '''
+    select
+        date_trunc('day', transaction_datetime)::date as day,
+        customer_id,
+        transaction_id
+    from test_data
+    where transaction_datetime >= :start_day
+      and transaction_datetime < cast(:end_day as date) + 1
+    '''
+)
+
+ALL_DAY_IDS = text(
+    '''
+    select
+        date_trunc('day', transaction_datetime)::date as day,
+        customer_id,
+        transaction_id
+    from test_data
+    where transaction_datetime is not null
+    '''
+)
+
+SKETCHES = text(
+    '''
+    select precision, customers, transactions
+    from daily_sketches
+    '''
+)
+
+SKETCHES_FOR_DAYS = text(
+    '''
+    select precision, customers, transactions
+    from daily_sketches
+    where day >= :start_day and day <= :end_day
+    '''
+)
+
+
+#stored sketches are either the full registers or, while few of them are
+#set, (register, rank) pairs, which merge without expanding every sketch
+DENSE = b'd'
+SPARSE = b's'
+_SPARSE_ENTRY = np.dtype([('index', '<u2'), ('rank', 'u1')])
+
+MIN_PRECISION, MAX_PRECISION = 4, 16
+
+
+#number of significant bits of every value of an uint64 array
+def _bit_length(values):
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = (values >> np.uint64(shift)) != 0
+        lengths[big] += shift
+        values[big] >>= np.uint64(shift)
+    lengths += (values != 0).astype(np.uint8)
+    return lengths
+
+
+#64 bit hashes of the non null values, stable across processes
+def hash_values(values):
+    values = pd.Series(values).dropna()
+    return pd.util.hash_array(values.to_numpy(dtype=object))
+
+
+#register index and rank (position of the first set bit) of every hash
+#the top `precision` bits pick the register, the rest give the rank
+def _index_rank(hashes, precision):
+    rest_bits = 64 - precision
+    index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    rank = rest_bits - _bit_length(rest).astype(np.int64) + 1
+    return index, rank.astype(np.uint8)
+
+
+#HyperLogLog cardinality sketch with 2**precision registers
+#the relative standard error of estimate() is about 1.04 / sqrt(2**precision)
+class HyperLogLog:
+
+    def __init__(self, precision=None, registers=None):
+        self.precision = precision or config.HLL_PRECISION
+        if not MIN_PRECISION <= self.precision <= MAX_PRECISION:
+            raise ValueError(f"HyperLogLog precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        if registers is None:
+            registers = np.zeros(1 << self.precision, dtype=np.uint8)
+        self.registers = registers
+
+    def update(self, values):
+        index, rank = _index_rank(hash_values(values), self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision < self.precision:
+            self.registers = self.fold(other.precision).registers
+            self.precision = other.precision
+        elif other.precision > self.precision:
+            other = other.fold(self.precision)
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    #the same sketch with fewer registers, so sketches of different precision can merge
+    #the low bits of the old register index become the leading bits of the rank
+    def fold(self, precision):
+        if precision >= self.precision:
+            return self
+        dropped = self.precision - precision
+        low = np.arange(1 << dropped, dtype=np.uint64)
+        low_rank = (dropped - _bit_length(low).astype(np.int64) + 1).astype(np.uint8)
+        registers = self.registers.reshape(1 << precision, 1 << dropped)
+        ranks = np.where(low > 0, low_rank, registers.astype(np.int64) + dropped)
+        ranks = np.where(registers > 0, ranks, 0)
+        return HyperLogLog(precision, ranks.max(axis=1).astype(np.uint8))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        #linear counting for small cardinalities
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    #the registers for storage, sparse while that is smaller
+    def to_bytes(self):
+        index = np.flatnonzero(self.registers)
+        if len(index) * _SPARSE_ENTRY.itemsize >= len(self.registers):
+            return DENSE + self.registers.tobytes()
+        entries = np.empty(len(index), dtype=_SPARSE_ENTRY)
+        entries['index'] = index
+        entries['rank'] = self.registers[index]
+        return SPARSE + entries.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, precision):
+        return _merge_blobs([data], precision)
+
+
+#one sketch from many stored ones of the same precision
+#all the sparse entries are scattered in one go, dense registers are stacked
+def _merge_blobs(blobs, precision):
+    blobs = [bytes(blob) for blob in blobs]
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    sparse = b''.join(blob[1:] for blob in blobs if blob[:1] == SPARSE)
+    if sparse:
+        entries = np.frombuffer(sparse, dtype=_SPARSE_ENTRY)
+        np.maximum.at(registers, entries['index'], entries['rank'])
+    dense = b''.join(blob[1:] for blob in blobs if blob[:1] == DENSE)
+    if dense:
+        stacked = np.frombuffer(dense, dtype=np.uint8).reshape(-1, 1 << precision)
+        np.maximum(registers, stacked.max(axis=0), out=registers)
+    return HyperLogLog(precision, registers)
+
+
+#sketch a frame of (day, customer_id, transaction_id) rows into `days`
+#rows of all the days in the batch are hashed at once, each day's
+#registers are then updated with one scatter max
+def _sketch_batch(days, df, precision):
+    df = df.dropna(subset=['day'])
+    if df.empty:
+        return
+    codes, uniques = pd.factorize(df['day'])
+    for column, slot in (('customer_id', 0), ('transaction_id', 1)):
+        valid = df[column].notna().to_numpy()
+        index, rank = _index_rank(hash_values(df[column]), precision)
+        day_codes = codes[valid]
+        registers = np.zeros((len(uniques), 1 << precision), dtype=np.uint8)
+        np.maximum.at(registers, (day_codes, index), rank)
+        for code in np.unique(day_codes):
+            day = pd.Timestamp(uniques[code]).date()
+            sketch = days.setdefault(day, (HyperLogLog(precision), HyperLogLog(precision)))[slot]
+            np.maximum(sketch.registers, registers[code], out=sketch.registers)
+
+
+def ensure_sketches(connection):
+    connection.execute(CREATE_DAILY_SKETCHES)
+
+
+def _write(connection, days, precision):
+    rows = [
+        {
+            'day': day,
+            'precision': precision,
+            'customers': customers.to_bytes(),
+            'transactions': transactions.to_bytes(),
+        }
+        for day, (customers, transactions) in sorted(days.items())
+    ]
+    if rows:
+        connection.execute(INSERT_DAY, rows)
+
+
+#recompute the sketches of every day between start and end (inclusive)
+#runs inside the caller's transaction, once the other writers have committed
+def refresh_days(connection, start, end):
+    params = {
+        'start_day': pd.Timestamp(start).date(),
+        'end_day': pd.Timestamp(end).date(),
+    }
+    lock_writers(connection)
+    precision = config.HLL_PRECISION
+    days = {}
+    for df in iter_frames(DAY_IDS, params, connection=connection):
+        _sketch_batch(days, df, precision)
+    ensure_sketches(connection)
+    connection.execute(DELETE_DAYS, params)
+    _write(connection, days, precision)
+
+
+#throw the sketches away and rebuild them from the whole fact table
+def rebuild(connection):
+    precision = config.HLL_PRECISION
+    days = {}
+    for df in iter_frames(ALL_DAY_IDS, connection=connection):
+        _sketch_batch(days, df, precision)
+    ensure_sketches(connection)
+    connection.execute(text('delete from daily_sketches'))
+    _write(connection, days, precision)
+
+
+#merge a frame of stored sketches into one sketch per column
+#sketches stored at another precision are folded to the smallest one present
+def merge_frame(df):
+    if df.empty:
+        return HyperLogLog(), HyperLogLog()
+    precision = min(int(df['precision'].min()), config.HLL_PRECISION)
+    merged = []
+    for column in ('customers', 'transactions'):
+        result = HyperLogLog(precision)
+        for stored, group in df.groupby('precision'):
+            result.merge(_merge_blobs(group[column], int(stored)))
+        merged.append(result)
+    return tuple(merged)
+
+
+#the sketch queries to read for a date range, all of history without one
+def sketch_query(start_day=None, end_day=None):
+    if start_day is None and end_day is None:
+        return SKETCHES, None
+    return SKETCHES_FOR_DAYS, {
+        'start_day': pd.Timestamp(start_day or '0001-01-01').date(),
+        'end_day': pd.Timestamp(end_day or '9999-12-31').date(),
+    }
+
+
+#estimated (distinct customers, distinct transactions) between two days
+#both ends are inclusive, leave them out for all of history
+def distinct_counts(start_day=None, end_day=None):
+    query, params = sketch_query(start_day, end_day)
+    customers, transactions = merge_frame(read_cached(query, params))
+    return customers.estimate(), transactions.estimate()
+
+
+#distinct counts of one calendar year
+def distinct_counts_for_year(year):
+    return distinct_counts(f"{int(year)}-01-01", f"{int(year)}-12-31")
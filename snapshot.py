@@ -0,0 +1,371 @@
+import glob
+import os
+import re
+import shutil
+import threading
+
+import pandas as pd
+from sqlalchemy import exc, text
+
+import config
+import metrics
+import paths
+from async_db import to_positional
+from frames import compact, iter_frames, read_frame
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+#columnar snapshot of the dashboard's tables as an alternative read backend
+#with QUERY_BACKEND=parquet the result cache answers its misses from parquet
+#files under SNAPSHOT_DIR instead of postgres, so dashboard traffic never
+#touches the database the loads write to:
+#   test_data/year=<y>/month=<m>/data.parquet   the transactions of one month,
+#                                                sorted by transaction_datetime
+#   daily_rollup.parquet, daily_sketches.parquet, customer_features.parquet
+#                                                copies of the derived tables
+#loads rewrite only the months they touched and copy the derived tables again
+#the queries run unchanged on duckdb, which prunes row groups with the parquet
+#min/max statistics of transaction_datetime, or on pandas group-bys written
+#for the dashboard's own queries (SNAPSHOT_ENGINE=pandas)
+#anything the snapshot cannot answer still goes to postgres
+
+TRANSACTIONS = 'test_data'
+DERIVED = ('daily_rollup', 'daily_sketches', 'customer_features')
+
+MONTH_ROWS = text(
+    '''
+    select transaction_id, customer_id, transaction_datetime,
+           sent_amount, received_amount, balance_then
+    from test_data
+    where transaction_datetime >= :start and transaction_datetime < :end
+    order by transaction_datetime
+    '''
+)
+
+MONTHS = text(
+    '''
+    select distinct date_trunc('month', day)::date as month
+    from daily_rollup
+    '''
+)
+
+#tables a query reads, to decide whether the snapshot has all of them
+#a `from` closed by a parenthesis is extract(... from day), not a table
+_TABLES = re.compile(r'\b(?:from|join)\s+([a-z_][a-z0-9_]*)\b(?!\s*\))', re.IGNORECASE)
+
+_local = threading.local()
+
+
+def enabled():
+    return config.QUERY_BACKEND == 'parquet'
+
+
+#nobody else may write to the snapshot, a planted file would be served as data
+def _path(*parts):
+    return os.path.join(paths.private_dir(config.SNAPSHOT_DIR), *parts)
+
+
+def _month_dir(month):
+    return _path(TRANSACTIONS, f"year={month.year}", f"month={month.month}")
+
+
+def _files(name):
+    if name == TRANSACTIONS:
+        return _path(TRANSACTIONS, '*', '*', '*.parquet')
+    return _path(f"{name}.parquet")
+
+
+def _has_table(name):
+    return bool(glob.glob(_files(name)))
+
+
+#write the result of a query to a parquet file, replacing it atomically
+#the rows are written in row groups of SNAPSHOT_ROW_GROUP_ROWS
+def _write(query, params, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    writer = None
+    try:
+        for df in iter_frames(query, params, batch_rows=config.SNAPSHOT_ROW_GROUP_ROWS):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table.cast(writer.schema), row_group_size=config.SNAPSHOT_ROW_GROUP_ROWS)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None or not pq.ParquetFile(tmp).metadata.num_rows:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.replace(tmp, path)
+
+
+def _month_starts(start, end):
+    start = pd.Timestamp(start).to_period('M').start_time
+    return pd.date_range(start, pd.Timestamp(end), freq='MS')
+
+
+def _refresh_month(month):
+    params = {'start': month.to_pydatetime(), 'end': (month + pd.DateOffset(months=1)).to_pydatetime()}
+    _write(MONTH_ROWS, params, os.path.join(_month_dir(month), 'data.parquet'))
+
+
+def _refresh_derived():
+    for name in DERIVED:
+        try:
+            _write(text(f"select * from {name}"), None, _path(f"{name}.parquet"))
+        except exc.ProgrammingError:
+            #the table has not been created yet
+            continue
+
+
+#rewrite the months between start and end and copy the derived tables
+#call after the load and the rollup refresh have committed
+def refresh_range(start, end):
+    if not enabled() or start is None or end is None or pd.isna(start) or pd.isna(end):
+        return
+    _check_dependencies()
+    for month in _month_starts(start, end):
+        _refresh_month(month)
+    _refresh_derived()
+
+
+#rebuild the whole snapshot from postgres
+def rebuild():
+    _check_dependencies()
+    months = read_frame(MONTHS)['month']
+    shutil.rmtree(_path(TRANSACTIONS), ignore_errors=True)
+    os.makedirs(_path(TRANSACTIONS))
+    for month in months:
+        _refresh_month(pd.Timestamp(month))
+    _refresh_derived()
+
+
+def _check_dependencies():
+    if pa is None:
+        raise RuntimeError('the parquet snapshot needs pyarrow')
+    if config.SNAPSHOT_ENGINE == 'duckdb' and duckdb is None:
+        raise RuntimeError("SNAPSHOT_ENGINE=duckdb needs duckdb, or set SNAPSHOT_ENGINE=pandas")
+
+
+#one duckdb connection per thread and process
+def _duckdb():
+    connection = getattr(_local, 'duckdb', None)
+    if connection is None or _local.pid != os.getpid():
+        connection = duckdb.connect()
+        _local.duckdb = connection
+        _local.pid = os.getpid()
+        _local.views = set()
+    return connection
+
+
+#a view per snapshot table, created once its files exist
+#the glob is expanded on every query, so rewritten months are picked up
+def _create_views(connection, tables):
+    for name in tables:
+        if name in _local.views:
+            continue
+        files = _files(name).replace("'", "''")
+        if name == TRANSACTIONS:
+            source = f"select * exclude (year, month) from read_parquet('{files}', hive_partitioning = true)"
+        else:
+            source = f"select * from read_parquet('{files}')"
+        connection.execute(f"create or replace view {name} as {source}")
+        _local.views.add(name)
+
+
+def _tables(query):
+    return set(_TABLES.findall(str(query)))
+
+
+#whether the snapshot can answer a query: every table it reads is in the
+#snapshot and, on pandas, the query is one of the dashboard's
+def handles(query):
+    if not enabled() or pa is None:
+        return False
+    if config.SNAPSHOT_ENGINE == 'pandas':
+        if str(query) not in _pandas_queries():
+            return False
+    elif duckdb is None:
+        return False
+    tables = _tables(query)
+    return bool(tables) and all(t in DERIVED + (TRANSACTIONS,) and _has_table(t) for t in tables)
+
+
+#run one of the dashboard's queries on the snapshot
+def read(query, params=None):
+    if config.SNAPSHOT_ENGINE == 'pandas':
+        df = _pandas_queries()[str(query)](params or {})
+    else:
+        connection = _duckdb()
+        _create_views(connection, _tables(query))
+        sql, args = to_positional(query, params)
+        df = connection.execute(sql, args).df()
+    metrics.observe_rows(len(df))
+    return compact(df.reset_index(drop=True))
+
+
+#pandas implementations of the dashboard's queries ---------------------------
+
+def _read_table(name, columns=None, filters=None):
+    if name == TRANSACTIONS:
+        #the dataset reader skips month directories and row groups using
+        #the partition values and the min/max statistics of the filter columns
+        return pd.read_parquet(_path(TRANSACTIONS), columns=columns, filters=filters)
+    return pd.read_parquet(_files(name), columns=columns, filters=filters)
+
+
+def _rollup():
+    df = _read_table('daily_rollup')
+    df['day'] = pd.to_datetime(df['day'])
+    return df.assign(year=df['day'].dt.year, month=df['day'].dt.month)
+
+
+def _years(params):
+    years = sorted(_rollup()['year'].unique())
+    return pd.DataFrame({'years': years})
+
+
+def _date_range(params):
+    df = _rollup()
+    return pd.DataFrame({'first_day': [df['day'].min()], 'last_day': [df['day'].max()]})
+
+
+def _per_year(column, name):
+    def query(params):
+        df = _rollup().groupby('year', as_index=False)[column].sum()
+        return df.rename(columns={column: name})[[name, 'year']]
+    return query
+
+
+def _amounts_per_month(df):
+    df = df.groupby(['month', 'year'], as_index=False)[['received', 'sent', 'net_balance']].sum()
+    df = df.rename(columns={'net_balance': 'balance', 'year': 'years'})
+    return df.sort_values('month', ascending=False)[['received', 'sent', 'balance', 'years', 'month']]
+
+
+def _amounts_for_year(params):
+    df = _rollup()
+    return _amounts_per_month(df[df['year'] == int(params['year'])])
+
+
+#date_trunc for each grain the date chart uses, weeks start on monday
+_TRUNCATE = {
+    'day': lambda day: day,
+    'week': lambda day: day - pd.to_timedelta(day.dt.dayofweek, unit='D'),
+    'month': lambda day: day.dt.to_period('M').dt.start_time,
+    'quarter': lambda day: day.dt.to_period('Q').dt.start_time,
+    'year': lambda day: day.dt.to_period('Y').dt.start_time,
+}
+
+
+def _transactions_per_period(params):
+    df = _rollup()
+    df = df[(df['day'] >= pd.Timestamp(params['start_day'])) & (df['day'] <= pd.Timestamp(params['end_day']))]
+    df = df.assign(transaction_date=_TRUNCATE[params['grain']](df['day']))
+    df = df.groupby('transaction_date', as_index=False)['transactions'].sum()
+    return df[['transactions', 'transaction_date']]
+
+
+def _kpis(params):
+    df = _read_table(TRANSACTIONS, ['customer_id', 'transaction_id', 'sent_amount', 'received_amount', 'balance_then'])
+    net = (df['received_amount'] + df['balance_then']) - df['sent_amount']
+    return pd.DataFrame([{
+        'total_customers': df['customer_id'].nunique(),
+        'total_transactions': df['transaction_id'].nunique(),
+        'amount_sent': df['sent_amount'].sum(),
+        'amount_received': df['received_amount'].sum(),
+        'net_balance': net.sum(),
+    }])
+
+
+def _totals(params):
+    df = _read_table('daily_rollup')
+    return pd.DataFrame([{
+        'amount_sent': df['sent'].sum(),
+        'amount_received': df['received'].sum(),
+        'net_balance': df['net_balance'].sum(),
+    }])
+
+
+def _sketches(params):
+    df = _read_table('daily_sketches')
+    if 'start_day' in params:
+        day = pd.to_datetime(df['day'])
+        df = df[(day >= pd.Timestamp(params['start_day'])) & (day <= pd.Timestamp(params['end_day']))]
+    return df[['precision', 'customers', 'transactions']]
+
+
+def _top_customers(metric):
+    def query(params):
+        df = _read_table('customer_features')
+        df = df.sort_values([metric, 'customer_id'], ascending=[False, True]).head(int(params['limit']))
+        return df[['customer_id', 'transactions', 'sent', 'received', 'last_transaction', 'last_balance']]
+    return query
+
+
+def _customer(params):
+    return _read_table('customer_features', filters=[('customer_id', '==', params['customer_id'])])
+
+
+def _customer_activity(params):
+    df = _read_table(TRANSACTIONS, ['customer_id', 'transaction_datetime', 'sent_amount', 'received_amount'],
+                     filters=[('customer_id', '==', params['customer_id'])])
+    df = df.assign(day=pd.to_datetime(df['transaction_datetime']).dt.normalize())
+    df = df.groupby('day', as_index=False).agg(
+        transactions=('customer_id', 'size'),
+        sent=('sent_amount', 'sum'),
+        received=('received_amount', 'sum'),
+    )
+    return df.sort_values('day')
+
+
+#sql text of each query -> its pandas implementation, built on first use
+#because the query modules read through the cache, which imports this one
+def _pandas_queries():
+    queries = getattr(_pandas_queries, 'queries', None)
+    if queries is None:
+        import customers
+        import kpis
+        import rollups
+        import sketches
+
+        queries = {
+            rollups.YEARS: _years,
+            rollups.DATE_RANGE: _date_range,
+            rollups.TRANSACTIONS_PER_YEAR: _per_year('transactions', 'transactions'),
+            rollups.SENT_PER_YEAR: _per_year('sent', 'sent'),
+            rollups.RECEIVED_PER_YEAR: _per_year('received', 'received'),
+            rollups.NET_BALANCE_PER_YEAR: _per_year('net_balance', 'balance'),
+            rollups.AMOUNTS_PER_MONTH: lambda params: _amounts_per_month(_rollup()),
+            rollups.AMOUNTS_PER_MONTH_FOR_YEAR: _amounts_for_year,
+            rollups.TRANSACTIONS_PER_PERIOD: _transactions_per_period,
+            kpis.KPI_QUERY: _kpis,
+            kpis.TOTALS_QUERY: _totals,
+            sketches.SKETCHES: _sketches,
+            sketches.SKETCHES_FOR_DAYS: _sketches,
+            customers.CUSTOMER: _customer,
+            customers.CUSTOMER_ACTIVITY: _customer_activity,
+        }
+        queries = {str(query): fn for query, fn in queries.items()}
+        for metric in customers.METRICS:
+            query, _ = customers.top_customers_query(metric, 1)
+            queries[str(query)] = _top_customers(metric)
+        _pandas_queries.queries = queries
+    return queries
+
+
+if __name__ == "__main__":
+    rebuild()
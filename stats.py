@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+#one pass summary statistics for data that arrives in chunks
+#every accumulator can be updated with a chunk and merged with another one,
+#so a file is summarised while it is parsed, without a second pass and
+#without ever holding all of it in memory
+
+#quantiles reported in the summary, the same as df.describe()
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+#mergeable approximate quantile sketch
+#a simplified t-digest: values are kept as weighted centroids, small near
+#the tails and larger in the middle, and compressed to about
+#`compression` centroids whatever the number of values seen
+class QuantileSketch:
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self._means = np.array([], dtype='float64')
+        self._weights = np.array([], dtype='float64')
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self._buffer.append(values)
+        self._buffered += values.size
+        if self._buffered > 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self._compress()
+        self._compress_centroids(
+            np.concatenate([self._means, other._means]),
+            np.concatenate([self._weights, other._weights]),
+        )
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        values = np.concatenate(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self._compress_centroids(
+            np.concatenate([self._means, values]),
+            np.concatenate([self._weights, np.ones(values.size)]),
+        )
+
+    def _compress_centroids(self, means, weights):
+        if means.size == 0:
+            return
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        #k1 scale function, every centroid spans at most one unit of k
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q_left - 1)
+        groups = np.floor(k - k[0]).astype('int64')
+        self._weights = np.bincount(groups, weights=weights)
+        keep = self._weights > 0
+        self._means = (np.bincount(groups, weights=means * weights)[keep]) / self._weights[keep]
+        self._weights = self._weights[keep]
+
+    #approximate value at quantile q (0..1), nan when nothing was seen
+    def quantile(self, q):
+        self._compress()
+        if self._means.size == 0:
+            return float('nan')
+        if self._means.size == 1:
+            return float(self._means[0])
+        centers = np.cumsum(self._weights) - self._weights / 2
+        return float(np.interp(q * self._weights.sum(), centers, self._means))
+
+
+#count, mean, std (welford / chan), min, max and quantiles of one column
+class RunningStats:
+
+    def __init__(self, compression=200):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(compression)
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        batch_mean = values.mean()
+        self._combine(values.size, batch_mean, ((values - batch_mean) ** 2).sum(),
+                      values.min(), values.max())
+        self.sketch.update(values)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other._m2, other.min, other.max)
+            self.sketch.merge(other.sketch)
+
+    #chan et al. parallel update of count, mean and sum of squared deviations
+    def _combine(self, count, mean, m2, low, high):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, float(low))
+        self.max = max(self.max, float(high))
+
+    #sample standard deviation, like pandas
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else float('nan')
+
+    #the same keys as df.describe() for one column
+    def describe(self):
+        if not self.count:
+            return {'count': 0}
+        summary = {'count': self.count, 'mean': self.mean, 'std': self.std, 'min': self.min}
+        for q in QUANTILES:
+            summary[f"{q:.0%}"] = self.sketch.quantile(q)
+        summary['max'] = self.max
+        return summary
+
+
+#running statistics for every numeric column of a chunked DataFrame
+class FrameStats:
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.columns = {}
+
+    def update(self, chunk):
+        for col in chunk.select_dtypes('number').columns:
+            stats = self.columns.setdefault(col, RunningStats(self.compression))
+            stats.update(chunk[col].to_numpy(dtype='float64', na_value=np.nan))
+
+    def merge(self, other):
+        for col, stats in other.columns.items():
+            self.columns.setdefault(col, RunningStats(self.compression)).merge(stats)
+
+    #statistics per column in the same shape as df.describe().to_dict()
+    def to_dict(self):
+        return {col: stats.describe() for col, stats in self.columns.items()}
+
+    def to_frame(self):
+        return pd.DataFrame(self.to_dict())
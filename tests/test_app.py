@@ -0,0 +1,59 @@
+import pandas as pd
+
+import app
+import config
+import customers
+
+
+#before the first load customer_features is empty and its columns untyped
+def test_top_customers_empty_feature_table(monkeypatch):
+    empty = pd.DataFrame({
+        'customer_id': pd.Series([], dtype=object),
+        'transactions': pd.Series([], dtype=object),
+        'sent': pd.Series([], dtype=object),
+        'received': pd.Series([], dtype=object),
+        'last_transaction': pd.Series([], dtype=object),
+        'last_balance': pd.Series([], dtype=object),
+    })
+    monkeypatch.setattr(customers, 'top_customers', lambda metric, limit: empty)
+    assert app.update_top_customers(1, 'transactions') == []
+
+
+#the upload job id is client state, a path in its place must not reach the
+#file system (cancel would create <path>/cancel, forget would delete it)
+def test_upload_callback_refuses_crafted_job_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'JOBS_DIR', str(tmp_path / 'jobs'))
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'keep').write_text('')
+    outputs = [('upload-status', 'children'), ('summary-stats', 'children'), ('data-visualization', 'figure'),
+               ('upload-job', 'data'), ('upload-progress', 'disabled')]
+    payload = {
+        'output': '..' + '...'.join(f"{id}.{prop}" for id, prop in outputs) + '..',
+        'outputs': [{'id': id, 'property': prop} for id, prop in outputs],
+        'inputs': [
+            {'id': 'upload-data', 'property': 'contents', 'value': None},
+            {'id': 'upload-progress', 'property': 'n_intervals', 'value': None},
+            {'id': 'cancel-upload', 'property': 'n_clicks', 'value': 1},
+        ],
+        'state': [
+            {'id': 'upload-data', 'property': 'filename', 'value': None},
+            {'id': 'upload-job', 'property': 'data', 'value': str(outside)},
+        ],
+        'changedPropIds': ['cancel-upload.n_clicks'],
+    }
+    client = app.create_app().server.test_client()
+    response = client.post('/_dash-update-component', json=payload)
+    assert response.status_code == 200
+    assert response.get_json()['response']['upload-status']['children'] == 'Upload job not found.'
+    assert sorted(p.name for p in outside.iterdir()) == ['keep']
+
+
+#a failed prefetch must still refresh the panels, the version it was for
+#is already recorded and the interval would not trigger it again
+def test_refresh_survives_failed_prefetch(monkeypatch):
+    def fail(queries):
+        raise ConnectionRefusedError('database is down')
+
+    monkeypatch.setattr(app, 'prefetch', fail)
+    assert app.refresh_dashboard_data(7) == 7
@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import text
+
+import batch_ingest
+import rollups
+
+CSV = ('transaction_id,customer_id,transaction_datetime,sent_amount,received_amount,balance_then\n'
+       'BATCHTEST1,C1,2020-01-01 08:00,10.0,0.0,100.0\n'
+       'BATCHTEST2,C1,2020-01-02 09:00,0.0,5.0,105.0\n')
+
+
+#the rollups commit with the rows, a refresh that fails takes the load with
+#it and the file is not recorded, so the next run loads it again
+def test_failed_refresh_rolls_back_the_load(postgres, tmp_path, monkeypatch):
+    path = tmp_path / 'transactions.csv'
+    path.write_text(CSV)
+    manifest = tmp_path / 'manifest.json'
+
+    def fail(connection, start, end):
+        raise RuntimeError('refresh failed')
+
+    monkeypatch.setattr(rollups, 'refresh_days', fail)
+    with pytest.raises(RuntimeError):
+        batch_ingest.ingest([str(path)], manifest_path=str(manifest), workers=1)
+
+    assert not manifest.exists()
+    with postgres.connect() as connection:
+        stored = connection.execute(text(
+            "select count(*) from test_data where transaction_id like 'BATCHTEST%'")).scalar()
+    assert stored == 0
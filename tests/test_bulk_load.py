@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import text
+
+from bulk_load import load_chunks
+
+
+def _chunk(rows):
+    return pd.DataFrame(rows, columns=[
+        'transaction_id', 'customer_id', 'transaction_datetime',
+        'sent_amount', 'received_amount', 'balance_then',
+    ]).astype({'transaction_datetime': 'datetime64[ns]'})
+
+
+#the table is range partitioned (schema.py), loading the same rows twice
+#must merge them instead of failing or duplicating them
+def test_load_twice_into_partitioned_table(postgres, table_name):
+    rows = [
+        ('T1', 'C1', '2019-12-31 23:00', 10.0, 0.0, 100.0),
+        ('T2', 'C1', '2020-01-01 08:00', 0.0, 5.0, 105.0),
+        ('T3', 'C2', '2020-06-01 12:00', 1.0, 0.0, 50.0),
+    ]
+    first = load_chunks([_chunk(rows)], table=table_name)
+    assert (first.inserted, first.updated, first.skipped) == (3, 0, 0)
+
+    rows[1] = ('T2', 'C1', '2020-01-01 08:00', 0.0, 7.0, 107.0)
+    rows.append(('T4', 'C2', '2021-03-01 09:00', 2.0, 0.0, 48.0))
+    second = load_chunks([_chunk(rows)], table=table_name)
+    assert (second.inserted, second.updated, second.skipped) == (1, 1, 2)
+
+    with postgres.connect() as connection:
+        kind = connection.execute(text('select relkind from pg_class where relname = :t'), {'t': table_name}).scalar()
+        count = connection.execute(text(f"select count(*) from {table_name}")).scalar()
+        received = connection.execute(text(f"select received_amount from {table_name} where transaction_id = 'T2'")).scalar()
+    assert kind == 'p'
+    assert count == 4
+    assert received == 7.0
+
+
+
+#a second load into the same table waits for the first instead of
+#deadlocking with it, and neither blocks the dashboard's reads
+def test_concurrent_loads_into_new_periods(postgres, table_name):
+    load_chunks([_chunk([('T0', 'C0', '2019-01-01 00:00', 1.0, 0.0, 1.0)])], table=table_name)
+    copying, release = threading.Event(), threading.Event()
+
+    def paused(rows):
+        yield _chunk(rows)
+        copying.set()
+        release.wait(timeout=10)
+
+    first = [('A1', 'C1', '2020-02-01 10:00', 1.0, 0.0, 1.0), ('A2', 'C1', '2020-03-01 10:00', 1.0, 0.0, 2.0)]
+    second = [('B1', 'C2', '2021-02-01 10:00', 0.0, 1.0, 1.0), ('A2', 'C1', '2020-03-01 10:00', 1.0, 0.0, 2.0)]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        loads = [pool.submit(load_chunks, paused(first), table=table_name)]
+        assert copying.wait(timeout=10)
+        loads.append(pool.submit(load_chunks, [_chunk(second)], table=table_name))
+        with postgres.connect() as connection:
+            connection.execute(text("set lock_timeout = '2s'"))
+            assert connection.execute(text(f"select count(*) from {table_name}")).scalar() == 1
+        release.set()
+        reports = [load.result(timeout=30) for load in loads]
+
+    assert [(r.inserted, r.skipped) for r in reports] == [(2, 0), (1, 1)]
+    with postgres.connect() as connection:
+        count = connection.execute(text(f"select count(*) from {table_name}")).scalar()
+    assert count == 4
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import cache
+import config
+import paths
+
+
+@pytest.fixture
+def private_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CACHE_PATH', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(config, 'CACHE_ENABLED', 1)
+    monkeypatch.setattr(cache, '_local', type(cache._local)())
+
+
+#one failing query (e.g. a rollup table not created yet) must not keep the
+#others out of the cache
+def test_prefetch_skips_failed_queries(postgres, private_cache):
+    good = (text('select 1 as n'), None)
+    bad = (text('select n from table_that_does_not_exist'), None)
+    cache.prefetch([bad, good])
+    assert cache.get(cache.make_key(*good)) is not None
+    assert cache.get(cache.make_key(*bad)) is None
+    pd.testing.assert_frame_equal(cache.read_cached(*good), cache.get(cache.make_key(*good)))
+
+
+def test_cache_directory_is_created_private(tmp_path, monkeypatch):
+    path = tmp_path / 'dashboard' / 'cache.sqlite'
+    monkeypatch.setattr(config, 'CACHE_PATH', str(path))
+    monkeypatch.setattr(cache, '_local', type(cache._local)())
+    cache.put(cache.make_key('select 1'), pd.DataFrame({'n': [1]}))
+    assert (path.parent.stat().st_mode & 0o777) == 0o700
+
+
+#a world writable directory (e.g. the shared temp dir) lets anyone plant
+#a cache file full of pickles
+def test_cache_refuses_shared_directory(tmp_path, monkeypatch):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o1777)
+    monkeypatch.setattr(config, 'CACHE_PATH', str(shared / 'cache.sqlite'))
+    monkeypatch.setattr(cache, '_local', type(cache._local)())
+    with pytest.raises(paths.UnsafePath):
+        cache.current_version()
+
+
+def test_cache_refuses_file_owned_by_someone_else(tmp_path, monkeypatch):
+    import os
+
+    if not hasattr(os, 'getuid') or os.getuid() != 0:
+        pytest.skip('needs root to hand the file to another user')
+    directory = tmp_path / 'dashboard'
+    directory.mkdir(mode=0o700)
+    planted = directory / 'cache.sqlite'
+    planted.write_bytes(b'')
+    os.chown(planted, 65534, 65534)
+    monkeypatch.setattr(config, 'CACHE_PATH', str(planted))
+    monkeypatch.setattr(cache, '_local', type(cache._local)())
+    with pytest.raises(paths.UnsafePath):
+        cache.current_version()
+
+
+#prefetch fills the cache for the callbacks, only their lookups count
+def test_prefetch_does_not_count_lookups(postgres, private_cache):
+    query = (text('select 2 as n'), None)
+    before = cache.cache_stats()
+    cache.prefetch([query])
+    cache.read_cached(*query)
+    after = cache.cache_stats()
+    assert after['hits'] - before['hits'] == 1
+    assert after['misses'] - before['misses'] == 0
+    assert after['prefetched'] - before['prefetched'] == 1
+
+
+#the asyncpg pool failing to open (database down, bad password) is a
+#failed prefetch too, the callbacks then read through read_cached
+def test_prefetch_survives_pool_failure(private_cache, monkeypatch):
+    import async_db
+
+    if async_db.asyncpg is None:
+        pytest.skip('needs asyncpg')
+
+    async def refuse():
+        raise ConnectionRefusedError('database is down')
+
+    monkeypatch.setattr(async_db, '_pool', refuse)
+    query = (text('select 3 as n'), None)
+    cache.prefetch([query])
+    assert cache.get(cache.make_key(*query)) is None
@@ -0,0 +1,18 @@
+from sqlalchemy import text
+
+from frames import iter_frames
+
+
+#iter_frames streams on the caller's connection, the statements that follow
+#in the same transaction (e.g. sketches.refresh_days) must run normally
+def test_connection_usable_after_iter_frames(postgres, table_name):
+    with postgres.begin() as connection:
+        connection.execute(text(f"create table {table_name} (n integer)"))
+        connection.execute(text(f"insert into {table_name} select generate_series(1, 10)"))
+        frames = list(iter_frames(text(f"select n from {table_name}"), batch_rows=3, connection=connection))
+        assert sum(len(df) for df in frames) == 10
+        assert 'stream_results' not in connection.get_execution_options()
+        connection.execute(text(f"create table if not exists {table_name}_after (n integer)"))
+        connection.execute(text(f"delete from {table_name} where n > 5"))
+        assert connection.execute(text(f"select count(*) from {table_name}")).scalar() == 5
+        connection.execute(text(f"drop table {table_name}_after"))
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from histogram import MAX_BINS, DatetimeHistogram
+
+
+@pytest.fixture
+def timestamps():
+    rng = np.random.default_rng(7)
+    start = np.datetime64('2020-01-01T00:00:00', 'ns')
+    seconds = rng.gamma(shape=2.0, scale=86400 * 30, size=50000).astype('int64')
+    return start + seconds.astype('timedelta64[s]')
+
+
+def _histogram(values, chunk=4000):
+    histogram = DatetimeHistogram()
+    for start in range(0, len(values), chunk):
+        histogram.update(values[start:start + chunk])
+    return histogram
+
+
+def test_empty():
+    histogram = DatetimeHistogram()
+    histogram.update([])
+    histogram.update(pd.Series([pd.NaT, pd.NaT]))
+    edges, counts = histogram.bins()
+    assert len(edges) == 0 and len(counts) == 0
+    assert histogram.total == 0
+
+
+def test_single_timestamp():
+    histogram = DatetimeHistogram()
+    histogram.update(pd.Series([pd.Timestamp('2021-03-04 05:06:30'), pd.NaT]))
+    edges, counts = histogram.bins()
+    assert counts.tolist() == [1]
+    assert edges[0] <= np.datetime64('2021-03-04T05:06') < edges[1]
+
+
+#the counts are numpy's histogram of the timestamps (at the histogram's
+#resolution) over the returned edges
+def test_counts_match_numpy(timestamps):
+    edges, counts = _histogram(timestamps).bins()
+    ticks = timestamps.astype('datetime64[m]').astype('int64')
+    expected, _ = np.histogram(ticks, bins=edges.astype('int64'))
+    np.testing.assert_array_equal(counts, expected)
+    assert counts.sum() == len(timestamps)
+    assert 1 < len(counts) <= MAX_BINS
+    assert edges[0] <= timestamps.min().astype('datetime64[m]')
+    assert edges[-1] > timestamps.max().astype('datetime64[m]')
+
+
+def test_chunks_and_merge_match_one_pass(timestamps):
+    whole = DatetimeHistogram()
+    whole.update(timestamps)
+    merged = _histogram(timestamps[:20000])
+    merged.merge(_histogram(timestamps[20000:]))
+    for histogram in (_histogram(timestamps, chunk=1000), merged):
+        edges, counts = histogram.bins()
+        expected_edges, expected_counts = whole.bins()
+        np.testing.assert_array_equal(edges, expected_edges)
+        np.testing.assert_array_equal(counts, expected_counts)
+
+
+def test_bins_never_split_a_resolution_unit():
+    histogram = DatetimeHistogram()
+    histogram.update(np.array(['2020-01-01T00:00', '2020-01-01T00:02'], dtype='datetime64[ns]'))
+    edges, counts = histogram.bins()
+    assert len(counts) <= 3
+    assert counts.sum() == 2
+
+
+def test_merge_needs_the_same_resolution():
+    with pytest.raises(ValueError):
+        DatetimeHistogram('m').merge(DatetimeHistogram('s'))
@@ -0,0 +1,60 @@
+import base64
+import mmap
+
+import pandas as pd
+import pytest
+
+from ingest import Base64Reader, iter_csv_chunks
+
+CSV = ('transaction_id,customer_id,transaction_datetime,sent_amount,received_amount,balance_then\n'
+       'T1,C1,2020-01-01 08:00,10.0,0.0,100.0\n'
+       'T2,C2,2020-01-02 09:00,0.0,5.5,105.5\n'
+       'T3,C1,2020-01-03 10:00,1.0,0.0,104.5\n')
+
+
+def _read(reader, size=3):
+    data = b''
+    while chunk := reader.read(size):
+        data += chunk
+    return data
+
+
+#payloads of every length end with 0, 1 or 2 padding characters, blocks
+#split them at every offset
+@pytest.mark.parametrize('length', range(0, 13))
+@pytest.mark.parametrize('block', [4, 8, 12])
+def test_blocks_and_padding(length, block):
+    data = bytes(range(65, 65 + length))
+    assert _read(Base64Reader(base64.b64encode(data).decode(), block=block)) == data
+
+
+@pytest.mark.parametrize('prefix', ['data:text/csv;base64,', 'data:application/vnd.ms-excel;base64,', ''])
+def test_data_url_prefix_is_skipped(prefix):
+    payload = prefix + base64.b64encode(CSV.encode()).decode()
+    assert _read(Base64Reader(payload, block=8)) == CSV.encode()
+    assert _read(Base64Reader(payload.encode(), block=8)) == CSV.encode()
+
+
+#the background jobs read a spooled payload through an mmap
+def test_mmap_payload(tmp_path):
+    path = tmp_path / 'payload.b64'
+    path.write_bytes(b'data:text/csv;base64,' + base64.b64encode(CSV.encode()))
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as payload:
+        assert _read(Base64Reader(payload, block=16)) == CSV.encode()
+
+
+@pytest.mark.parametrize('payload', ['QUJDR', 'data:text/csv;base64,QUJD=Q', 'QQ='])
+def test_invalid_base64_raises(payload):
+    with pytest.raises(ValueError, match='not valid base64'):
+        _read(Base64Reader(payload))
+
+
+#parsed in chunks of chunk_rows with the upload's column types
+def test_csv_chunks():
+    payload = 'data:text/csv;base64,' + base64.b64encode(CSV.encode()).decode()
+    chunks = list(iter_csv_chunks(payload, chunk_rows=2))
+    assert [len(c) for c in chunks] == [2, 1]
+    df = pd.concat(chunks, ignore_index=True)
+    assert df['transaction_id'].tolist() == ['T1', 'T2', 'T3']
+    assert df['received_amount'].tolist() == [0.0, 5.5, 0.0]
+    assert str(df['transaction_datetime'].dtype).startswith('datetime64')
@@ -0,0 +1,54 @@
+import base64
+import os
+
+import pytest
+from sqlalchemy import text
+
+import config
+import jobs
+import paths
+import rollups
+
+CSV = ('transaction_id,customer_id,transaction_datetime,sent_amount,received_amount,balance_then\n'
+       'JOBTEST1,C1,2020-01-01 08:00,10.0,0.0,100.0\n'
+       'JOBTEST2,C1,2020-01-02 09:00,0.0,5.0,105.0\n')
+
+
+#a cancel that arrives after the merge, while the rollups are refreshed,
+#must still roll the load back
+def test_cancel_during_rollups_stores_nothing(postgres, tmp_path, monkeypatch):
+    job_dir = str(tmp_path)
+    with open(os.path.join(job_dir, 'payload.b64'), 'w') as f:
+        f.write(base64.b64encode(CSV.encode()).decode())
+    refresh_days = rollups.refresh_days
+
+    def cancel_midway(connection, start, end):
+        refresh_days(connection, start, end)
+        open(os.path.join(job_dir, 'cancel'), 'w').close()
+
+    monkeypatch.setattr(rollups, 'refresh_days', cancel_midway)
+    jobs.run_upload(job_dir)
+
+    status = jobs._read_json(os.path.join(job_dir, 'status.json'))
+    assert status['stage'] == jobs.CANCELLED
+    with postgres.connect() as connection:
+        stored = connection.execute(text(
+            "select count(*) from test_data where transaction_id like 'JOBTEST%'")).scalar()
+    assert stored == 0
+
+
+#a jobs directory someone else could write to (e.g. made first in the
+#shared temp dir) would let them plant status and result files
+def test_jobs_refuse_shared_directory(tmp_path, monkeypatch):
+    shared = tmp_path / 'jobs'
+    shared.mkdir()
+    shared.chmod(0o1777)
+    monkeypatch.setattr(config, 'JOBS_DIR', str(shared))
+    with pytest.raises(paths.UnsafePath):
+        jobs.job_status('0' * 32)
+
+
+def test_jobs_directory_is_created_private(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'JOBS_DIR', str(tmp_path / 'dashboard' / 'jobs'))
+    assert jobs.job_status('0' * 32) is None
+    assert ((tmp_path / 'dashboard' / 'jobs').stat().st_mode & 0o777) == 0o700
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+from sqlalchemy import exc, text
+
+import metrics
+from frames import read_frame
+
+
+def _rows_observed(name):
+    with metrics.ROWS_FETCHED._lock:
+        series = metrics.ROWS_FETCHED._series.get(name)
+        return series[1] if series else 0
+
+
+def _sql_seconds(name):
+    with metrics.SQL_SECONDS._lock:
+        series = metrics.SQL_SECONDS._series.get(name)
+        return series[1] if series else 0.0
+
+
+#reads stream off server side cursors, whose rowcount is -1, the rows are
+#counted as the frames are built
+def test_rows_fetched_counts_streamed_reads(postgres):
+    @metrics.instrumented
+    def read_some_rows():
+        return read_frame(text('select generate_series(1, 25) as n'))
+
+    before = _rows_observed('read_some_rows')
+    assert len(read_some_rows()) == 25
+    assert _rows_observed('read_some_rows') - before == 25
+
+
+#a failed statement never reaches after_cursor_execute, it is not recorded
+#and its start time is not paired with the statement that follows
+def test_failed_statement_is_not_timed(postgres, monkeypatch):
+    recorded = []
+    observe_sql = metrics.observe_sql
+
+    def record(seconds, statement=None):
+        recorded.append((seconds, ' '.join(str(statement).split())))
+        observe_sql(seconds, statement)
+
+    monkeypatch.setattr(metrics, 'observe_sql', record)
+
+    @metrics.instrumented
+    def fail_then_query():
+        with postgres.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(exc.ProgrammingError):
+                    connection.execute(text('select * from table_that_does_not_exist'))
+                connection.rollback()
+            time.sleep(0.3)
+            return connection.execute(text('select 1')).scalar()
+
+    before = _sql_seconds('fail_then_query')
+    assert fail_then_query() == 1
+    assert [statement for _, statement in recorded] == ['select 1']
+    assert recorded[0][0] < 0.3
+    assert _sql_seconds('fail_then_query') - before < 0.3
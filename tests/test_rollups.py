@@ -0,0 +1,67 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import rollups
+from app import visible_range
+
+
+#two loads refreshing the same day: the second waits for the first to
+#commit instead of failing on the day's primary key
+def test_concurrent_refreshes_of_the_same_day(postgres):
+    with postgres.connect() as connection:
+        day = connection.execute(text('select min(transaction_datetime)::date from test_data')).scalar()
+        before = connection.execute(text('select * from daily_rollup where day = :day'), {'day': day}).all()
+    refreshed = threading.Event()
+
+    def first():
+        with postgres.begin() as connection:
+            rollups.refresh_days(connection, day, day)
+            refreshed.set()
+            time.sleep(0.5)
+
+    def second():
+        assert refreshed.wait(timeout=10)
+        with postgres.begin() as connection:
+            rollups.refresh_days(connection, day, day)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for refresh in [pool.submit(first), pool.submit(second)]:
+            refresh.result(timeout=30)
+
+    with postgres.connect() as connection:
+        after = connection.execute(text('select * from daily_rollup where day = :day'), {'day': day}).all()
+    assert after == before
+
+
+#every grain up to the number of days it may span with 100 points, then one
+#more day, which needs the next grain
+@pytest.mark.parametrize('days, grain', [
+    (1, 'day'), (100, 'day'), (101, 'week'),
+    (700, 'week'), (701, 'month'),
+    (3000, 'month'), (3001, 'quarter'),
+    (9100, 'quarter'), (9101, 'year'),
+    (36500, 'year'),
+])
+def test_choose_grain_boundaries(days, grain):
+    start = pd.Timestamp('2020-01-01')
+    assert rollups.choose_grain(start, start + pd.Timedelta(days=days - 1), 100) == grain
+
+
+@pytest.mark.parametrize('relayout, expected', [
+    (None, None),
+    ({}, None),
+    ({'xaxis.autorange': True}, None),
+    ({'dragmode': 'pan'}, None),
+    ({'xaxis.range[0]': '2020-01-01'}, None),
+    ({'xaxis.range': ['2020-01-01']}, None),
+    ({'xaxis.range[0]': '2020-01-01', 'xaxis.range[1]': '2020-03-01'}, ('2020-01-01', '2020-03-01')),
+    ({'xaxis.range[0]': '2020-03-01 12:00', 'xaxis.range[1]': '2020-01-01'}, ('2020-01-01', '2020-03-01 12:00')),
+    ({'xaxis.range': ['2021-01-01', '2020-06-01']}, ('2020-06-01', '2021-01-01')),
+])
+def test_visible_range(relayout, expected):
+    assert visible_range(relayout) == expected
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from sketches import DENSE, SPARSE, HyperLogLog
+
+
+def _ids(start, stop):
+    return [f"C{i}" for i in range(start, stop)]
+
+
+@pytest.mark.parametrize('precision, cardinality', [(14, 100000), (12, 20000), (10, 50)])
+def test_estimate_within_error_bound(precision, cardinality):
+    estimate = HyperLogLog(precision).update(_ids(0, cardinality)).estimate()
+    #three standard errors
+    assert abs(estimate - cardinality) / cardinality < 3 * 1.04 / np.sqrt(1 << precision)
+
+
+def test_estimate_ignores_duplicates_and_nulls():
+    values = _ids(0, 1000) * 3 + [None, np.nan]
+    assert HyperLogLog(12).update(values).estimate() == HyperLogLog(12).update(_ids(0, 1000)).estimate()
+
+
+def test_empty_sketch_estimates_zero():
+    assert HyperLogLog(12).estimate() == 0
+
+
+#merging is the register wise max, the sketch of the union exactly
+def test_merge_matches_union():
+    first = HyperLogLog(12).update(_ids(0, 6000))
+    second = HyperLogLog(12).update(_ids(4000, 10000))
+    union = HyperLogLog(12).update(_ids(0, 10000))
+    merged = first.merge(second)
+    np.testing.assert_array_equal(merged.registers, union.registers)
+
+
+#folding moves the dropped index bits into the rank, the result is the
+#sketch that would have been built at the lower precision
+@pytest.mark.parametrize('high, low', [(14, 10), (12, 11), (16, 4)])
+def test_fold_matches_lower_precision(high, low):
+    values = _ids(0, 30000)
+    folded = HyperLogLog(high).update(values).fold(low)
+    assert folded.precision == low
+    np.testing.assert_array_equal(folded.registers, HyperLogLog(low).update(values).registers)
+
+
+def test_merge_across_precisions_folds_to_the_lower():
+    fine = HyperLogLog(14).update(_ids(0, 5000))
+    coarse = HyperLogLog(10).update(_ids(3000, 8000))
+    merged = fine.merge(coarse)
+    assert merged.precision == 10
+    np.testing.assert_array_equal(merged.registers, HyperLogLog(10).update(_ids(0, 8000)).registers)
+
+
+#few set registers are stored sparse, many dense, both read back the same
+@pytest.mark.parametrize('cardinality, kind', [(20, SPARSE), (50000, DENSE)])
+def test_bytes_round_trip(cardinality, kind):
+    sketch = HyperLogLog(12).update(_ids(0, cardinality))
+    data = sketch.to_bytes()
+    assert data[:1] == kind
+    restored = HyperLogLog.from_bytes(data, 12)
+    np.testing.assert_array_equal(restored.registers, sketch.registers)
+    assert restored.estimate() == sketch.estimate()
+
+
+def test_precision_out_of_range():
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+    with pytest.raises(ValueError):
+        HyperLogLog(17)
@@ -0,0 +1,96 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import config
+import paths
+import snapshot
+from frames import read_frame
+
+
+#the snapshot answers the dashboard's queries, a directory others can write
+#to would let them plant parquet files that every panel then shows
+def test_snapshot_refuses_shared_directory(tmp_path, monkeypatch):
+    shared = tmp_path / 'snapshot'
+    shared.mkdir()
+    shared.chmod(0o1777)
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(shared))
+    monkeypatch.setattr(config, 'QUERY_BACKEND', 'parquet')
+    with pytest.raises(paths.UnsafePath):
+        snapshot.handles(text('select day from daily_rollup'))
+
+
+#a snapshot of the test database, queried by the pandas engine with duckdb
+#treated as not installed
+@pytest.fixture
+def pandas_snapshot(postgres, tmp_path, monkeypatch):
+    if snapshot.pa is None:
+        pytest.skip('needs pyarrow')
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(tmp_path / 'snapshot'))
+    monkeypatch.setattr(config, 'QUERY_BACKEND', 'parquet')
+    monkeypatch.setattr(config, 'SNAPSHOT_ENGINE', 'pandas')
+    monkeypatch.setattr(snapshot, 'duckdb', None)
+    snapshot.rebuild()
+
+
+def _normalized(df, keys):
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            converted = pd.to_datetime(df[col], errors='coerce')
+            if converted.notna().all():
+                df[col] = converted
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].astype('datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype('float64')
+    return df.sort_values(keys).reset_index(drop=True)
+
+
+def _dashboard_queries():
+    import customers
+    import kpis
+    import rollups
+
+    return [
+        (rollups.YEARS, None, ['years']),
+        (rollups.DATE_RANGE, None, ['first_day']),
+        (rollups.TRANSACTIONS_PER_YEAR, None, ['year']),
+        (rollups.NET_BALANCE_PER_YEAR, None, ['year']),
+        (rollups.AMOUNTS_PER_MONTH, None, ['years', 'month']),
+        (rollups.AMOUNTS_PER_MONTH_FOR_YEAR, {'year': 2018}, ['month']),
+        (rollups.TRANSACTIONS_PER_PERIOD,
+         {'grain': 'month', 'start_day': date(2018, 3, 15), 'end_day': date(2019, 6, 30)}, ['transaction_date']),
+        (kpis.KPI_QUERY, None, ['total_customers']),
+        (kpis.TOTALS_QUERY, None, ['amount_sent']),
+        (*customers.top_customers_query('sent', 10), ['sent', 'customer_id']),
+    ]
+
+
+#every dashboard query answered from the snapshot by pandas matches postgres
+def test_pandas_engine_matches_postgres(pandas_snapshot):
+    for query, params, keys in _dashboard_queries():
+        assert snapshot.handles(query), query
+        expected = read_frame(query, params)
+        actual = snapshot.read(query, params)
+        assert not expected.empty, query
+        pd.testing.assert_frame_equal(_normalized(actual, keys), _normalized(expected, keys),
+                                      check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+#the tables a query reads decide whether the snapshot can answer it
+def test_table_routing(pandas_snapshot, monkeypatch):
+    import rollups
+
+    assert snapshot._tables(rollups.TRANSACTIONS_PER_YEAR) == {'daily_rollup'}
+    assert snapshot._tables(text('select * from test_data t join customer_features c using (customer_id)')) \
+        == {'test_data', 'customer_features'}
+    #on pandas only the dashboard's own queries are answered
+    assert not snapshot.handles(text('select count(*) from daily_rollup'))
+    #a table that is not in the snapshot goes to postgres
+    assert not snapshot.handles(text('select * from test_data_two'))
+    #duckdb asked for but not installed, everything goes to postgres
+    monkeypatch.setattr(config, 'SNAPSHOT_ENGINE', 'duckdb')
+    assert not snapshot.handles(rollups.TRANSACTIONS_PER_YEAR)
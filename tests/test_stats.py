@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stats import FrameStats, QuantileSketch, RunningStats
+
+
+@pytest.fixture
+def sample():
+    rng = np.random.default_rng(42)
+    return pd.Series(rng.lognormal(mean=8, sigma=1.5, size=100000))
+
+
+def _chunks(values, size=7000):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+#the rank of an approximate quantile is what the sketch bounds, not its value
+def _rank(values, value):
+    return np.searchsorted(np.sort(values), value) / len(values)
+
+
+def test_running_stats_match_pandas(sample):
+    stats = RunningStats()
+    for chunk in _chunks(sample.to_numpy()):
+        stats.update(chunk)
+    assert stats.count == len(sample)
+    assert stats.mean == pytest.approx(sample.mean(), rel=1e-9)
+    assert stats.std == pytest.approx(sample.std(), rel=1e-9)
+    assert (stats.min, stats.max) == (sample.min(), sample.max())
+
+
+@pytest.mark.parametrize('q', [0.01, 0.25, 0.5, 0.75, 0.99])
+def test_quantiles_close_to_pandas(sample, q):
+    sketch = QuantileSketch()
+    for chunk in _chunks(sample.to_numpy()):
+        sketch.update(chunk)
+    assert abs(_rank(sample, sketch.quantile(q)) - q) < 0.01
+    assert sketch.quantile(q) == pytest.approx(sample.quantile(q), rel=0.05)
+
+
+#statistics of two halves merged are those of the whole
+def test_merge_matches_single_pass(sample):
+    values = sample.to_numpy()
+    first, second, whole = RunningStats(), RunningStats(), RunningStats()
+    first.update(values[:30000])
+    second.update(values[30000:])
+    whole.update(values)
+    first.merge(second)
+    assert first.count == whole.count
+    assert first.mean == pytest.approx(sample.mean(), rel=1e-9)
+    assert first.std == pytest.approx(sample.std(), rel=1e-9)
+    assert abs(_rank(sample, first.sketch.quantile(0.5)) - 0.5) < 0.01
+
+
+def test_nans_are_ignored_like_pandas():
+    values = np.array([1.0, np.nan, 3.0, np.nan, 8.0])
+    stats = RunningStats()
+    stats.update(values)
+    series = pd.Series(values)
+    assert stats.count == series.count()
+    assert stats.mean == pytest.approx(series.mean())
+    assert stats.std == pytest.approx(series.std())
+
+
+def test_empty():
+    stats = RunningStats()
+    stats.update(np.array([], dtype='float64'))
+    stats.update(np.array([np.nan]))
+    assert stats.describe() == {'count': 0}
+    assert math.isnan(stats.std)
+    assert math.isnan(QuantileSketch().quantile(0.5))
+    merged = RunningStats()
+    merged.merge(stats)
+    assert merged.count == 0
+
+
+#one value: pandas gives a nan std and the value for every quantile
+def test_single_value():
+    stats = RunningStats()
+    stats.update(np.array([42.5]))
+    expected = pd.Series([42.5]).describe()
+    summary = stats.describe()
+    assert list(summary) == list(expected.index)
+    assert math.isnan(summary['std']) and math.isnan(expected['std'])
+    for key in ('count', 'mean', 'min', '25%', '50%', '75%', 'max'):
+        assert summary[key] == expected[key]
+
+
+#FrameStats has the shape of df.describe() for the numeric columns
+def test_frame_stats_like_describe(sample):
+    df = pd.DataFrame({'amount': sample, 'count': np.arange(len(sample)), 'name': 'x'})
+    stats = FrameStats()
+    for start in range(0, len(df), 7000):
+        stats.update(df.iloc[start:start + 7000])
+    summary, expected = stats.to_frame(), df.describe()
+    assert list(summary.columns) == list(expected.columns)
+    assert list(summary.index) == list(expected.index)
+    for row in ('count', 'mean', 'std', 'min', 'max'):
+        np.testing.assert_allclose(summary.loc[row], expected.loc[row], rtol=1e-9)
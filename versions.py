@@ -0,0 +1,56 @@
+from sqlalchemy import exc, text
+
+import cache
+from database import connect, get_engine
+
+#data version counter kept in postgres
+#every load bumps it, the dashboard polls it with a single row lookup and
+#only re-runs its queries when it moves, so idle dashboards cost almost
+#nothing and loads from any host or process are picked up
+
+CREATE_TABLE = text(
+    '''
+    create table if not exists data_version (
+        id integer primary key default 1 check (id = 1),
+        version bigint not null,
+        updated_at timestamptz not null default now()
+    )
+    '''
+)
+
+BUMP = text(
+    '''
+    insert into data_version (id, version) values (1, 1)
+    on conflict (id) do update
+    set version = data_version.version + 1, updated_at = now()
+    returning version
+    '''
+)
+
+PROBE = text(
+    '''
+    select version from data_version where id = 1
+    '''
+)
+
+
+#record a load, call after the load and its rollups are committed
+def bump():
+    with get_engine().begin() as connection:
+        connection.execute(CREATE_TABLE)
+        version = connection.execute(BUMP).scalar()
+    cache.sync_version(version)
+    return version
+
+
+#current data version, 0 before the first load
+#the local result cache is invalidated when it has moved
+def probe():
+    try:
+        with connect() as connection:
+            version = connection.execute(PROBE).scalar() or 0
+    except exc.ProgrammingError:
+        #the table is created by the first load
+        version = 0
+    cache.sync_version(version)
+    return version
@@ -0,0 +1,37 @@
+import logging
+
+import async_db
+import database
+import versions
+from app import create_app
+
+#wsgi entry point for production
+#
+#   gunicorn wsgi:server
+#
+#importing this module does no i/o, so gunicorn can preload it in the master
+#and fork the workers from it, every worker then opens its own connections
+#in on_worker_start (called from gunicorn.conf.py)
+
+logger = logging.getLogger('dashboard.wsgi')
+
+app = create_app()
+server = app.server
+
+
+#per worker startup, runs in the worker right after the fork
+#drops anything inherited from the master and warms this worker's pool
+#a database that is not up yet is logged, the worker still starts and
+#connects on its first request
+def on_worker_start():
+    database.dispose()
+    try:
+        versions.probe()
+    except Exception as e:
+        logger.warning('could not reach the database on worker start: %s', e)
+
+
+#per worker shutdown, closes this worker's connections
+def on_worker_exit():
+    async_db.close()
+    database.dispose()